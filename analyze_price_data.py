@@ -1,20 +1,216 @@
 import os
 import json
-import glob
-import statistics
-from datetime import datetime
+import math
+from collections import Counter
 import multiprocessing
+import argparse
+import functools
+import fnmatch
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-def analyze_file(file_path):
+import numpy as np
+
+from process_data import bounded_map
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # Only needed to read zstd-compressed (.json.zst) files
+    zstandard = None
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; delta_stats falls back to NumPy
+    njit = None
+
+# orjson parsing and the per-point loop in _history_to_arrays hold the GIL, so threads
+# (--use-threads) mostly overlap file reads, e.g. on network filesystems
+DEFAULT_THREAD_WORKERS = (os.cpu_count() or 1) * 2
+BINCOUNT_MAX_DELTA = 1 << 16 # Largest delta (seconds) histogrammed with np.bincount instead of np.unique
+ARRAY_CACHE_SUFFIX = ".npz" # Sidecar holding the parsed price/timestamp arrays of a JSON file
+MAX_PROCESS_CHUNKSIZE = 4 # Upper bound on files per process-pool task, so uneven file sizes still balance
+PENDING_FILES_PER_THREAD = 2 # Files per --use-threads worker submitted ahead of the result being consumed
+ZSTD_SUFFIX = ".zst" # download_price_history.py --compress writes price_history_yes_{id}.json.zst
+JSON_FILE_SUFFIXES = ('.json', '.json' + ZSTD_SUFFIX)
+
+# Bit flags in analyze_file's results["flags"], so the summary counts without parsing issue strings
+ISSUE_EMPTY = 1 # No history, empty history or no valid points
+ISSUE_READ_ERROR = 2 # File missing, invalid JSON or unreadable
+ISSUE_CONSTANT_PRICE = 4
+ISSUE_LOW_DATA = 8
+
+SUMMARY_FLUSH_BLOCKS = 64 # Per-file summary blocks buffered before one write to analysis_summary.txt
+
+def _delta_stats_numpy(timestamps):
+    """NumPy implementation of delta_stats."""
+    time_deltas = np.diff(timestamps)
+    min_delta, max_delta = time_deltas.min(), time_deltas.max()
+    if min_delta >= 0 and max_delta < BINCOUNT_MAX_DELTA:
+        # Typical sampling intervals are small non-negative ints: one counting pass, no sort
+        delta_counts = np.bincount(time_deltas)
+        unique_deltas = np.flatnonzero(delta_counts)
+        delta_counts = delta_counts[unique_deltas]
+    else:
+        unique_deltas, delta_counts = np.unique(time_deltas, return_counts=True)
+    return (min_delta, max_delta, time_deltas.mean(), np.median(time_deltas),
+            unique_deltas, delta_counts)
+
+if njit is not None:
+    @njit(cache=True)
+    def _delta_stats_numba(timestamps):
+        """Numba implementation of delta_stats: one fused pass for min/max/sum, then a sort for median and counts."""
+        n = timestamps.shape[0] - 1
+        time_deltas = np.empty(n, dtype=np.int64)
+        d_min = timestamps[1] - timestamps[0]
+        d_max = d_min
+        total = 0
+        for i in range(n):
+            d = timestamps[i + 1] - timestamps[i]
+            time_deltas[i] = d
+            total += d
+            if d < d_min:
+                d_min = d
+            if d > d_max:
+                d_max = d
+        time_deltas.sort()
+        median = (time_deltas[(n - 1) // 2] + time_deltas[n // 2]) / 2.0
+
+        # Run-length encode the sorted deltas into (unique value, count) pairs
+        unique_deltas = np.empty(n, dtype=np.int64)
+        delta_counts = np.empty(n, dtype=np.int64)
+        k = 0
+        unique_deltas[0] = time_deltas[0]
+        delta_counts[0] = 1
+        for i in range(1, n):
+            if time_deltas[i] == unique_deltas[k]:
+                delta_counts[k] += 1
+            else:
+                k += 1
+                unique_deltas[k] = time_deltas[i]
+                delta_counts[k] = 1
+        return d_min, d_max, total / n, median, unique_deltas[:k + 1], delta_counts[:k + 1]
+
+    _delta_stats_impl = _delta_stats_numba
+else:
+    _delta_stats_impl = _delta_stats_numpy
+
+def delta_stats(timestamps):
+    """
+    Computes statistics over the deltas between consecutive timestamps.
+
+    Args:
+        timestamps (np.ndarray): int64 array with at least two timestamps.
+
+    Returns:
+        tuple: (min, max, mean, median, unique_deltas, counts), where
+               unique_deltas is sorted and counts[i] is the number of
+               occurrences of unique_deltas[i].
+    """
+    return _delta_stats_impl(timestamps)
+
+def _init_worker():
+    """
+    Process pool initializer: pays the one-off warm-up cost (Numba compiling or
+    loading delta_stats from its cache, orjson's first call) when the worker
+    starts, instead of inside its first analyze_file call.
+    """
+    delta_stats(np.array([0, 60, 120], dtype=np.int64))
+    if orjson:
+        orjson.loads(b'{"history": [{"p": 0.5, "t": 0}]}')
+
+def _history_to_arrays(history):
+    """
+    Converts a history payload into (prices, timestamps, malformed_points_count).
+
+    Accepts the API's list of {"p": ..., "t": ...} points as well as the
+    struct-of-arrays form {"p": [...], "t": [...]}; the latter converts
+    straight to arrays without a per-point Python loop, so future writers
+    should prefer it.
+    """
+    extra_malformed = 0
+    if isinstance(history, dict):
+        if len(history["p"]) == len(history["t"]):
+            try:
+                return (np.asarray(history["p"], dtype=np.float64),
+                        np.asarray(history["t"], dtype=np.int64), 0)
+            except (ValueError, TypeError, OverflowError):
+                pass # Fall back to validating point by point
+        extra_malformed = abs(len(history["p"]) - len(history["t"]))
+        history = [{"p": price, "t": timestamp} for price, timestamp in zip(history["p"], history["t"])]
+
+    # Fill preallocated arrays directly; no intermediate Python lists to copy from
+    prices = np.empty(len(history), dtype=np.float64)
+    timestamps = np.empty(len(history), dtype=np.int64)
+    num_valid = 0
+    malformed_points_count = extra_malformed
+    for point in history:
+        if isinstance(point, dict) and "p" in point and "t" in point:
+            try:
+                price = float(point["p"])
+                timestamp = int(point["t"])
+                timestamps[num_valid] = timestamp
+                prices[num_valid] = price
+                num_valid += 1
+            except (ValueError, TypeError, OverflowError):
+                malformed_points_count +=1
+        else:
+            malformed_points_count += 1
+
+    return prices[:num_valid], timestamps[:num_valid], malformed_points_count
+
+def _read_array_cache(file_path):
+    """Returns (prices, timestamps, malformed_points_count) from the .npz sidecar of file_path, or None if missing or stale."""
+    cache_path = file_path + ARRAY_CACHE_SUFFIX
+    try:
+        if os.stat(cache_path).st_mtime_ns < os.stat(file_path).st_mtime_ns:
+            return None
+        with np.load(cache_path) as cached:
+            return cached["p"], cached["t"], int(cached["m"])
+    except Exception: # Missing, stale or unreadable cache: re-parse the JSON
+        return None
+
+def _write_array_cache(file_path, prices, timestamps, malformed_points_count):
+    """Saves the parsed arrays next to file_path so later runs can skip JSON parsing."""
+    cache_path = file_path + ARRAY_CACHE_SUFFIX
+    temp_path = cache_path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, p=prices, t=timestamps, m=malformed_points_count)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write array cache {cache_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def load_json_file(file_path):
+    """Parses a JSON file, decompressing it first if it is zstd-compressed (.zst)."""
+    with open(file_path, 'rb') as f:
+        if file_path.endswith(ZSTD_SUFFIX):
+            if zstandard is None:
+                raise RuntimeError("the 'zstandard' package is required to read .zst files")
+            raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+        else:
+            raw = f.read()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def analyze_file(file_path, use_array_cache=False):
     """
     Analyzes a single price history JSON file.
 
     Args:
         file_path (str): The path to the JSON file.
+        use_array_cache (bool): Read/write the parsed prices and timestamps from/to
+                                a compressed .npz sidecar (file_path + ".npz").
 
     Returns:
         dict: A dictionary containing analysis results (filename, num_points, 
-              mean_price, std_dev_price, issues).
+              mean_price, std_dev_price, issues, and flags with the
+              ISSUE_* bits of the issues found).
               Returns None if the file is invalid or cannot be processed.
     """
     results = {
@@ -25,103 +221,295 @@ def analyze_file(file_path):
         "min_time": None,
         "max_time": None,
         "time_delta_stats": {},
-        "issues": []
+        "issues": [],
+        "flags": 0
     }
 
-    try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        results["issues"].append(f"File not found: {file_path}")
-        return results
-    except json.JSONDecodeError:
-        results["issues"].append(f"Invalid JSON format: {file_path}")
-        return results
-    except Exception as e:
-        results["issues"].append(f"Error processing file {file_path}: {str(e)}")
-        return results
+    cached = _read_array_cache(file_path) if use_array_cache else None
+    if cached is not None:
+        prices, timestamps, malformed_points_count = cached
+    else:
+        try:
+            data = load_json_file(file_path)
+        except FileNotFoundError:
+            results["issues"].append(f"File not found: {file_path}")
+            results["flags"] |= ISSUE_READ_ERROR
+            return results
+        except json.JSONDecodeError:
+            results["issues"].append(f"Invalid JSON format: {file_path}")
+            results["flags"] |= ISSUE_READ_ERROR
+            return results
+        except Exception as e:
+            results["issues"].append(f"Error processing file {file_path}: {str(e)}")
+            results["flags"] |= ISSUE_READ_ERROR
+            return results
 
-    history = data.get("history")
-    if not isinstance(history, list):
-        results["issues"].append("No 'history' key found, history is not a list, or history is empty.")
-        results["num_points"] = 0
-        return results
-    
-    if not history:
-        results["issues"].append("History list is empty.")
-        results["num_points"] = 0
-        return results
+        history = data.get("history")
+        is_struct_of_arrays = (isinstance(history, dict) and isinstance(history.get("p"), list)
+                               and isinstance(history.get("t"), list))
+        if not isinstance(history, list) and not is_struct_of_arrays:
+            results["issues"].append("No 'history' key found, history is not a list, or history is empty.")
+            results["flags"] |= ISSUE_EMPTY
+            results["num_points"] = 0
+            return results
+        
+        if not (max(len(history["p"]), len(history["t"])) if is_struct_of_arrays else history):
+            results["issues"].append("History list is empty.")
+            results["flags"] |= ISSUE_EMPTY
+            results["num_points"] = 0
+            return results
 
-    prices = []
-    timestamps = []
-    malformed_points_count = 0
-    for point in history:
-        if isinstance(point, dict) and "p" in point and "t" in point:
-            try:
-                price = float(point["p"])
-                timestamp = int(point["t"])
-                prices.append(price)
-                timestamps.append(timestamp)
-            except (ValueError, TypeError):
-                malformed_points_count +=1
-        else:
-            malformed_points_count += 1
+        prices, timestamps, malformed_points_count = _history_to_arrays(history)
+        if use_array_cache and prices.size:
+            _write_array_cache(file_path, prices, timestamps, malformed_points_count)
     
     if malformed_points_count > 0:
         results["issues"].append(f"{malformed_points_count} malformed data point(s) found and skipped.")
 
-    results["num_points"] = len(prices)
+    results["num_points"] = int(prices.size)
 
-    if not prices:
+    if not prices.size:
         results["issues"].append("No valid price data points found after parsing.")
+        results["flags"] |= ISSUE_EMPTY
         return results
 
-    results["mean_price"] = statistics.mean(prices)
+    results["mean_price"] = float(prices.mean())
 
     if results["num_points"] < 2:
         results["issues"].append("Not enough data points (need at least 2) to calculate standard deviation.")
     else:
-        results["std_dev_price"] = statistics.stdev(prices)
+        # Floating-point rounding in the mean can leave a tiny non-zero std for constant series
+        if prices.min() == prices.max():
+            results["std_dev_price"] = 0.0
+        else:
+            results["std_dev_price"] = float(prices.std(ddof=1))
         if results["std_dev_price"] == 0:
             results["issues"].append("Price is constant throughout the file (StdDev is 0).")
+            results["flags"] |= ISSUE_CONSTANT_PRICE
     
-    if timestamps:
+    if timestamps.size:
         try:
-            results["min_time"] = datetime.fromtimestamp(min(timestamps)).isoformat()
-            results["max_time"] = datetime.fromtimestamp(max(timestamps)).isoformat()
+            # Formatted in UTC by numpy, no datetime/tz lookup per file
+            results["min_time"] = str(np.datetime64(int(timestamps.min()), 's'))
+            results["max_time"] = str(np.datetime64(int(timestamps.max()), 's'))
         except Exception as e:
             results["issues"].append(f"Error processing timestamps for time range: {str(e)}")
         
-        time_deltas = []
-        if len(timestamps) > 1:
-            for i in range(len(timestamps) - 1):
-                time_deltas.append(timestamps[i+1] - timestamps[i])
-        
-        if time_deltas:
+        if timestamps.size > 1:
             try:
+                (min_delta, max_delta, mean_delta, median_delta,
+                 unique_deltas, delta_counts) = delta_stats(timestamps)
+                median_delta = float(median_delta)
                 results["time_delta_stats"] = {
-                    "min_delta_seconds": min(time_deltas),
-                    "max_delta_seconds": max(time_deltas),
-                    "mean_delta_seconds": round(statistics.mean(time_deltas), 2),
-                    "median_delta_seconds": statistics.median(time_deltas),
-                    "num_deltas": len(time_deltas)
+                    "min_delta_seconds": int(min_delta),
+                    "max_delta_seconds": int(max_delta),
+                    "mean_delta_seconds": round(float(mean_delta), 2),
+                    # statistics.median gave an int for an odd count and a float
+                    # (mean of the middle two) for an even one; keep that
+                    "median_delta_seconds": int(median_delta) if (timestamps.size - 1) % 2 else median_delta,
+                    "num_deltas": int(timestamps.size - 1)
                 }
-                delta_counts = {}
-                for delta in time_deltas:
-                    delta_counts[delta] = delta_counts.get(delta, 0) + 1
-                
-                non_60_deltas = {d: c for d, c in delta_counts.items() if d != 60}
-                if non_60_deltas:
-                    results["time_delta_stats"]["non_60_second_deltas"] = non_60_deltas
+                non_60_mask = unique_deltas != 60
+                if non_60_mask.any():
+                    results["time_delta_stats"]["non_60_second_deltas"] = dict(
+                        zip(unique_deltas[non_60_mask].tolist(), delta_counts[non_60_mask].tolist()))
             except Exception as e:
                 results["issues"].append(f"Error calculating time delta statistics: {str(e)}")
 
-    if prices and results["num_points"] < 5:
+    if results["num_points"] < 5:
         results["issues"].append(f"Very few data points ({results['num_points']}).")
+        results["flags"] |= ISSUE_LOW_DATA
 
     return results
 
+def iter_json_files(folder, pattern=None):
+    """
+    Yields (size, path) for each file to analyze in folder as the directory is read.
+
+    Without a pattern this is a plain '.json'/'.json.zst' suffix check; pattern is an
+    optional fnmatch-style filename filter (e.g. 'price_history_yes_*.json').
+    """
+    match_pattern = re.compile(fnmatch.translate(pattern)).match if pattern else None
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            if (match_pattern(name) if match_pattern else name.endswith(JSON_FILE_SUFFIXES)) and entry.is_file():
+                yield entry.stat().st_size, entry.path
+
+def list_json_files_largest_first(folder, pattern=None):
+    """
+    Returns the paths of the files to analyze, largest first.
+
+    File sizes vary a lot between markets; handing the biggest files out first
+    (longest-processing-time first) keeps one worker from being left with a
+    large file at the end while the others sit idle.
+    """
+    sized_files = sorted(iter_json_files(folder, pattern), reverse=True)
+    return [path for _, path in sized_files]
+
+def iter_analysis_results(json_files, workers=None, use_threads=False, num_files=None,
+                          use_array_cache=False):
+    """
+    Runs analyze_file over json_files in parallel and yields each result as it arrives.
+
+    Args:
+        json_files (iterable): Paths of the JSON files to analyze.
+        workers (int): Number of processes/threads. Defaults to one process per CPU,
+                       or DEFAULT_THREAD_WORKERS threads.
+        use_threads (bool): Use a thread pool instead of a multiprocessing pool.
+        num_files (int): Number of files in json_files, used to size process pool chunks.
+        use_array_cache (bool): Passed on to analyze_file.
+
+    Yields:
+        dict: analyze_file results; completion order when using processes, input order with threads.
+    """
+    analyze = functools.partial(analyze_file, use_array_cache=use_array_cache)
+    try:
+        if not use_threads:
+            workers = workers or os.cpu_count() or 1
+            # Small batches: fewer pickling round trips, but workers still pull new
+            # files as they finish instead of getting stuck behind a slow chunk
+            chunksize = min(MAX_PROCESS_CHUNKSIZE, max(1, (num_files or 0) // (4 * workers)))
+            with multiprocessing.Pool(processes=workers, initializer=_init_worker) as pool:
+                yield from pool.imap_unordered(analyze, json_files, chunksize=chunksize)
+        else:
+            workers = workers or DEFAULT_THREAD_WORKERS
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                yield from bounded_map(executor, analyze, json_files,
+                                       PENDING_FILES_PER_THREAD * workers)
+    except Exception as e:
+        print(f"An error occurred during parallel processing: {e}")
+
+class Welford:
+    """Running count, mean, variance (Welford's online algorithm), min and max of a stream of numbers."""
+    __slots__ = ('n', 'm', 'M2', 'min', 'max')
+
+    def __init__(self):
+        self.n = 0
+        self.m = 0.0
+        self.M2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.m
+        self.m += delta / self.n
+        self.M2 += delta * (x - self.m)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    def mean(self):
+        return self.m if self.n else None
+
+    def stdev(self):
+        return math.sqrt(self.M2 / (self.n - 1)) if self.n >= 2 else None
+
+def _histogram_median(value_counts):
+    """Exact median (same convention as statistics.median) of the values counted in value_counts."""
+    total = sum(value_counts.values())
+    if not total:
+        return None
+    lower_rank, upper_rank = (total - 1) // 2, total // 2
+    seen = 0
+    lower = None
+    for value in sorted(value_counts):
+        seen += value_counts[value]
+        if lower is None and seen > lower_rank:
+            lower = value
+        if seen > upper_rank:
+            return value if total % 2 else (lower + value) / 2
+
+def _new_accumulator():
+    """Returns the running counters and global statistics updated by _write_one."""
+    return {
+        "processed": 0,
+        "errors": 0,
+        "empty": 0,
+        "constant": 0,
+        "low_data": 0,
+        "num_points": Welford(),
+        "means": Welford(),
+        "std_devs": Welford(),
+        # num_points -> file count; exact median with memory bounded by distinct values, not files
+        "num_points_counts": Counter(),
+    }
+
+def _dumps_result(result):
+    """Serializes one analysis result to JSON bytes."""
+    if orjson:
+        # Delta histograms use int keys, which orjson only accepts with OPT_NON_STR_KEYS
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(result).encode('utf-8')
+
+def _format_one(result, acc):
+    """Returns the summary block for one analysis result as a single string and updates the accumulator."""
+    acc["processed"] += 1
+    parts = []
+    parts.append(f"File: {result['filename']}\n")
+    parts.append(f"  Number of Data Points: {result['num_points']}\n")
+    acc["num_points"].add(result['num_points'])
+    acc["num_points_counts"][result['num_points']] += 1
+
+    flags = result["flags"]
+    if flags & ISSUE_EMPTY:
+        acc["empty"] += 1
+    if flags & ISSUE_READ_ERROR:
+        acc["errors"] += 1
+    if flags & ISSUE_CONSTANT_PRICE:
+        acc["constant"] += 1
+    if flags & ISSUE_LOW_DATA:
+        acc["low_data"] += 1
+
+    if result["mean_price"] is not None:
+        parts.append(f"  Mean Price: {result['mean_price']:.4f}\n")
+        acc["means"].add(result['mean_price'])
+    else:
+        parts.append("  Mean Price: N/A\n")
+
+    if result["std_dev_price"] is not None:
+        parts.append(f"  Std Dev Price: {result['std_dev_price']:.4f}\n")
+        acc["std_devs"].add(result['std_dev_price'])
+    else:
+        parts.append("  Std Dev Price: N/A\n")
+
+    if result["min_time"] and result["max_time"]:
+        parts.append(f"  Time Range: {result['min_time']} to {result['max_time']}\n")
+    else:
+        parts.append("  Time Range: N/A\n")
+    
+    if result["time_delta_stats"]:
+        td_stats = result['time_delta_stats']
+        mean_delta_str = f"{td_stats.get('mean_delta_seconds', 'N/A'):.2f}" if isinstance(td_stats.get('mean_delta_seconds'), (int, float)) else 'N/A'
+        median_delta_str = f"{td_stats.get('median_delta_seconds', 'N/A')}" if isinstance(td_stats.get('median_delta_seconds'), (int, float)) else 'N/A'
+        parts.append(f"  Timestamp Differences (seconds):\n")
+        parts.append(f"    Min: {td_stats.get('min_delta_seconds', 'N/A')}, Max: {td_stats.get('max_delta_seconds', 'N/A')}, Mean: {mean_delta_str}, Median: {median_delta_str}\n")
+        if "non_60_second_deltas" in td_stats:
+            parts.append(f"    Irregular deltas (delta: count): {td_stats['non_60_second_deltas']}\n")
+    else:
+        parts.append("  Timestamp Differences (seconds): N/A (Not enough data or error)\n")
+
+    if result["issues"]:
+        parts.append(f"  Issues: {'; '.join(result['issues'])}\n")
+    else:
+        parts.append("  Issues: None\n")
+    parts.append("-" * 30 + "\n")
+    return "".join(parts)
+
 def main():
+    parser = argparse.ArgumentParser(description="Analyze downloaded price history JSON files.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"Number of parallel workers (default: one process per CPU, or {DEFAULT_THREAD_WORKERS} threads with --use-threads).")
+    parser.add_argument("--use-threads", action="store_true",
+                        help="Use a thread pool instead of a multiprocessing pool (mostly helps when file reads are slow, e.g. on NFS).")
+    parser.add_argument("--pattern", type=str, default=None,
+                        help="Filename pattern of the files to analyze, e.g. 'price_history_yes_*.json' (default: all .json and .json.zst files).")
+    parser.add_argument("--array-cache", action="store_true",
+                        help="Cache parsed prices/timestamps in a compressed .npz sidecar next to each JSON file and reuse it on later runs.")
+    args = parser.parse_args()
+
     price_data_folder = "price_history"
     output_file_path = "analysis_summary.txt"
     
@@ -130,146 +518,91 @@ def main():
         print("Please ensure the script is run from the workspace root or specify the correct path.")
         return
 
-    json_files = glob.glob(os.path.join(price_data_folder, "*.json"))
+    json_files = list_json_files_largest_first(price_data_folder, args.pattern)
+    num_files = len(json_files)
 
-    if not json_files:
+    if not num_files:
         print(f"No JSON files found in '{price_data_folder}'.")
         return
 
-    print(f"Found {len(json_files)} JSON files in '{price_data_folder}'. Processing with multiprocessing...")
+    print(f"Found {num_files} JSON files in '{price_data_folder}'. Processing with {'threads' if args.use_threads else 'multiprocessing'}...")
     
-    all_results = []
-    with multiprocessing.Pool() as pool:
-        try:
-            all_results = pool.map(analyze_file, json_files)
-        except Exception as e:
-            print(f"An error occurred during parallel processing: {e}")
-            pass
-
-    all_results = [res for res in all_results if res is not None]
+    results_output_path = "analysis_results.json"
+    acc = _new_accumulator()
 
     print("\n--- Analysis Summary ---")
-    
-    # For calculating global stats
-    valid_means = []
-    valid_std_devs = []
-    all_num_points = [] # Added for num_points stats
 
-    with open(output_file_path, 'w') as f_out:
+    # Results are written as they arrive; analysis_results.json is streamed as a JSON array
+    with open(output_file_path, 'w') as f_out, open(results_output_path, 'wb') as json_f_out:
         f_out.write("Price History Analysis Summary\n")
         f_out.write("=============================\n\n")
-        
-        processed_count = 0
-        error_files_count = 0
-        empty_files_count = 0
-        constant_price_files = 0
-        low_data_point_files = 0
-
-        for result in all_results:
-            processed_count += 1
-            f_out.write(f"File: {result['filename']}\n")
-            f_out.write(f"  Number of Data Points: {result['num_points']}\n")
-            all_num_points.append(result['num_points']) # Collect for global stats
-            
-            is_empty_or_no_data = "No 'history' key found" in '; '.join(result['issues']) or \
-                                  "History list is empty." in '; '.join(result['issues']) or \
-                                  "No valid price data points found" in '; '.join(result['issues'])
-            if is_empty_or_no_data:
-                 empty_files_count +=1
-
-            if result["mean_price"] is not None:
-                f_out.write(f"  Mean Price: {result['mean_price']:.4f}\n")
-                valid_means.append(result['mean_price']) # Collect for global stats
-            else:
-                f_out.write("  Mean Price: N/A\n")
+        json_f_out.write(b"[")
 
-            if result["std_dev_price"] is not None:
-                f_out.write(f"  Std Dev Price: {result['std_dev_price']:.4f}\n")
-                valid_std_devs.append(result['std_dev_price']) # Collect for global stats
-                if result["std_dev_price"] == 0 and result["num_points"] >= 2:
-                    constant_price_files +=1
-            else:
-                 f_out.write("  Std Dev Price: N/A\n")
-
-            if result["min_time"] and result["max_time"]:
-                f_out.write(f"  Time Range: {result['min_time']} to {result['max_time']}\n")
-            else:
-                f_out.write("  Time Range: N/A\n")
-            
-            if result["time_delta_stats"]:
-                td_stats = result['time_delta_stats']
-                mean_delta_str = f"{td_stats.get('mean_delta_seconds', 'N/A'):.2f}" if isinstance(td_stats.get('mean_delta_seconds'), (int, float)) else 'N/A'
-                median_delta_str = f"{td_stats.get('median_delta_seconds', 'N/A')}" if isinstance(td_stats.get('median_delta_seconds'), (int, float)) else 'N/A'
-                f_out.write(f"  Timestamp Differences (seconds):\n")
-                f_out.write(f"    Min: {td_stats.get('min_delta_seconds', 'N/A')}, Max: {td_stats.get('max_delta_seconds', 'N/A')}, Mean: {mean_delta_str}, Median: {median_delta_str}\n")
-                if "non_60_second_deltas" in td_stats:
-                    f_out.write(f"    Irregular deltas (delta: count): {td_stats['non_60_second_deltas']}\n")
-            else:
-                f_out.write("  Timestamp Differences (seconds): N/A (Not enough data or error)\n")
+        summary_blocks = []
+        for result in iter_analysis_results(json_files, args.workers,
+                                            args.use_threads, num_files, args.array_cache):
+            if result is None:
+                continue
+            json_f_out.write((b",\n" if acc["processed"] else b"\n") + _dumps_result(result))
+            summary_blocks.append(_format_one(result, acc))
+            if len(summary_blocks) >= SUMMARY_FLUSH_BLOCKS:
+                f_out.write("".join(summary_blocks))
+                summary_blocks.clear()
 
-            if f"Very few data points" in '; '.join(result['issues']):
-                low_data_point_files +=1
-
-            if result["issues"]:
-                f_out.write(f"  Issues: {'; '.join(result['issues'])}\n")
-                if any("File not found" in issue or "Invalid JSON" in issue or "Error processing file" in issue for issue in result['issues']):
-                    error_files_count +=1
-            else:
-                f_out.write("  Issues: None\n")
-            f_out.write("-" * 30 + "\n")
-            
             print(f"\nSummary for: {result['filename']}")
             print(f"  Points: {result['num_points']}, Mean: {result['mean_price'] if result['mean_price'] is not None else 'N/A'}, StdDev: {result['std_dev_price'] if result['std_dev_price'] is not None else 'N/A'}")
             if result["issues"]:
                 print(f"  Issues: {'; '.join(result['issues'])}")
-        
+
+        f_out.write("".join(summary_blocks))
+        json_f_out.write(b"\n]\n")
+
+        processed_count = acc["processed"]
+        error_files_count = acc["errors"]
+        empty_files_count = acc["empty"]
+        constant_price_files = acc["constant"]
+        low_data_point_files = acc["low_data"]
+
         # Calculate global statistics
-        global_average_mean_price = statistics.mean(valid_means) if valid_means else None
-        global_std_dev_of_means = statistics.stdev(valid_means) if len(valid_means) >= 2 else None
-        global_average_std_dev = statistics.mean(valid_std_devs) if valid_std_devs else None
-        global_std_dev_of_std_devs = statistics.stdev(valid_std_devs) if len(valid_std_devs) >= 2 else None
+        global_average_mean_price = acc["means"].mean()
+        global_std_dev_of_means = acc["means"].stdev()
+        global_average_std_dev = acc["std_devs"].mean()
+        global_std_dev_of_std_devs = acc["std_devs"].stdev()
 
         # Global stats for number of points
-        global_min_num_points = min(all_num_points) if all_num_points else None
-        global_max_num_points = max(all_num_points) if all_num_points else None
-        global_average_num_points = statistics.mean(all_num_points) if all_num_points else None
-        global_median_num_points = statistics.median(all_num_points) if all_num_points else None
-        global_std_dev_of_num_points = statistics.stdev(all_num_points) if len(all_num_points) >= 2 else None
-
-        f_out.write("\nOverall Statistics\n")
-        f_out.write("==================\n")
-        f_out.write(f"Total files found: {len(json_files)}\n")
-        f_out.write(f"Total files processed: {processed_count}\n")
-        f_out.write(f"Files with read/parse errors: {error_files_count}\n")
-        f_out.write(f"Files with no history/data points: {empty_files_count}\n")
-        f_out.write(f"Files with constant price: {constant_price_files}\n")
-        f_out.write(f"Files with very few data points (<5): {low_data_point_files}\n\n")
-        
-        f_out.write("Global Data Characteristics (across all processed files):\n") # Renamed section
-        f_out.write("  Number of Points:\n")
-        f_out.write(f"    Min: {global_min_num_points if global_min_num_points is not None else 'N/A'}\n")
-        f_out.write(f"    Max: {global_max_num_points if global_max_num_points is not None else 'N/A'}\n")
-        f_out.write(f"    Mean: {f'{global_average_num_points:.2f}' if global_average_num_points is not None else 'N/A'}\n")
-        f_out.write(f"    Median: {global_median_num_points if global_median_num_points is not None else 'N/A'}\n")
-        f_out.write(f"    Std Dev: {f'{global_std_dev_of_num_points:.2f}' if global_std_dev_of_num_points is not None else 'N/A'}\n")
-        f_out.write("  Mean Prices (of files with valid means):\n") # Clarified scope
-        f_out.write(f"    Average of Means: {f'{global_average_mean_price:.4f}' if global_average_mean_price is not None else 'N/A'}\n")
-        f_out.write(f"    Std Dev of Means: {f'{global_std_dev_of_means:.4f}' if global_std_dev_of_means is not None else 'N/A'}\n")
-        f_out.write("  Standard Deviations (of files with valid std devs):\n") # Clarified scope
-        f_out.write(f"    Average of Std Devs: {f'{global_average_std_dev:.4f}' if global_average_std_dev is not None else 'N/A'}\n")
-        f_out.write(f"    Std Dev of Std Devs: {f'{global_std_dev_of_std_devs:.4f}' if global_std_dev_of_std_devs is not None else 'N/A'}\n")
-
-    # Save all_results to a JSON file for other scripts to use
-    results_output_path = "analysis_results.json"
-    try:
-        with open(results_output_path, 'w') as json_f_out:
-            json.dump(all_results, json_f_out, indent=4)
-        print(f"\nFull analysis results saved to {results_output_path}")
-    except Exception as e:
-        print(f"\nError saving analysis results to JSON: {e}")
+        global_min_num_points = acc["num_points"].min
+        global_max_num_points = acc["num_points"].max
+        global_average_num_points = acc["num_points"].mean()
+        global_median_num_points = _histogram_median(acc["num_points_counts"])
+        global_std_dev_of_num_points = acc["num_points"].stdev()
+
+        f_out.write("".join([
+            "\nOverall Statistics\n",
+            "==================\n",
+            f"Total files found: {num_files}\n",
+            f"Total files processed: {processed_count}\n",
+            f"Files with read/parse errors: {error_files_count}\n",
+            f"Files with no history/data points: {empty_files_count}\n",
+            f"Files with constant price: {constant_price_files}\n",
+            f"Files with very few data points (<5): {low_data_point_files}\n\n",
+            "Global Data Characteristics (across all processed files):\n", # Renamed section
+            "  Number of Points:\n",
+            f"    Min: {global_min_num_points if global_min_num_points is not None else 'N/A'}\n",
+            f"    Max: {global_max_num_points if global_max_num_points is not None else 'N/A'}\n",
+            f"    Mean: {f'{global_average_num_points:.2f}' if global_average_num_points is not None else 'N/A'}\n",
+            f"    Median: {global_median_num_points if global_median_num_points is not None else 'N/A'}\n",
+            f"    Std Dev: {f'{global_std_dev_of_num_points:.2f}' if global_std_dev_of_num_points is not None else 'N/A'}\n",
+            "  Mean Prices (of files with valid means):\n", # Clarified scope
+            f"    Average of Means: {f'{global_average_mean_price:.4f}' if global_average_mean_price is not None else 'N/A'}\n",
+            f"    Std Dev of Means: {f'{global_std_dev_of_means:.4f}' if global_std_dev_of_means is not None else 'N/A'}\n",
+            "  Standard Deviations (of files with valid std devs):\n", # Clarified scope
+            f"    Average of Std Devs: {f'{global_average_std_dev:.4f}' if global_average_std_dev is not None else 'N/A'}\n",
+            f"    Std Dev of Std Devs: {f'{global_std_dev_of_std_devs:.4f}' if global_std_dev_of_std_devs is not None else 'N/A'}\n",
+        ]))
 
+    print(f"\nFull analysis results saved to {results_output_path}")
     print(f"\nDetailed summary written to {output_file_path}")
-    print(f"Overall: {len(json_files)} found, {processed_count} processed. Errors: {error_files_count}, Empty: {empty_files_count}, Constant: {constant_price_files}, Low Data: {low_data_point_files}")
+    print(f"Overall: {num_files} found, {processed_count} processed. Errors: {error_files_count}, Empty: {empty_files_count}, Constant: {constant_price_files}, Low Data: {low_data_point_files}")
     print("Global Data Characteristics (across all processed files):") # Renamed section
     print("  Number of Points:")
     print(f"    Min: {global_min_num_points if global_min_num_points is not None else 'N/A'}")
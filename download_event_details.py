@@ -8,6 +8,8 @@ by checking for existing event files in the output directory.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import argparse
@@ -15,11 +17,44 @@ import logging
 import os
 from pathlib import Path
 import concurrent.futures # Added for parallel execution
+import asyncio
+import functools
+import importlib.util
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # Optional on-demand parser used by extract_unique_event_ids
+    simdjson = None
+
+try:
+    import httpx
+except ImportError:  # Without httpx the threaded requests downloader is used
+    httpx = None
+
+# httpx only negotiates HTTP/2 when the optional 'h2' package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Container types returned by whichever parser is active (simdjson returns lazy proxies)
+if simdjson:
+    _JSON_ARRAY_TYPES = (list, simdjson.Array)
+    _JSON_OBJECT_TYPES = (dict, simdjson.Object)
+else:
+    _JSON_ARRAY_TYPES = (list,)
+    _JSON_OBJECT_TYPES = (dict,)
 
 # --- Constants ---
 GAMMA_API_BASE_URL = "https://gamma-api.polymarket.com"
 DEFAULT_SLEEP_TIME = 1.0  # Kept for potential future use, but not primary throttling
 NUM_WORKERS = 8  # Number of parallel download threads
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504] # Transient statuses retried with backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3 # Seconds; doubled on each retry
+ASYNC_CONCURRENCY_PER_WORKER = 4 # In-flight requests per --workers in the async downloader
 
 # --- Helper Functions ---
 def setup_logging(log_file_path):
@@ -42,6 +77,41 @@ def setup_logging(log_file_path):
     console_handler.setFormatter(log_formatter)
     root_logger.addHandler(console_handler)
 
+    # httpx logs every request at INFO; keep the log to our own progress lines
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def configure_session(session, pool_size):
+    """Mounts a pooled HTTPS adapter with retry/backoff on transient errors onto the session."""
+    retry = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+# Shared by all worker threads so keep-alive connections are reused instead of
+# paying a new TCP+TLS handshake per event. Resized in main to match --workers.
+SESSION = configure_session(requests.Session(), NUM_WORKERS * 2)
+
+def _add_line_event_ids(parse_line, line, event_ids, file_name, line_num):
+    """
+    Parses one market JSONL line and adds the IDs in its 'events' array to event_ids.
+
+    Kept as a separate function so simdjson proxies are released on return;
+    a simdjson parser cannot be reused while they are alive.
+    """
+    market_data = parse_line(line)
+    market_events = market_data.get('events')
+    # Check if 'events' key exists and is a list
+    if isinstance(market_events, _JSON_ARRAY_TYPES):
+        for event in market_events:
+            # Check if event is a dict and has an 'id'
+            if isinstance(event, _JSON_OBJECT_TYPES) and 'id' in event:
+                event_ids.add(str(event['id'])) # Ensure ID is string
+            else:
+                 logging.warning(f"Skipping invalid event structure in {file_name}, line {line_num}: {event}")
+    # Allow markets without an 'events' array or where it's not a list
+    elif 'events' in market_data:
+         logging.debug("Market in %s, line %s has non-list 'events' field: %s", file_name, line_num, type(market_events))
+
 def extract_unique_event_ids(market_data_dir):
     """
     Scans market data directory for .jsonl files and extracts unique event IDs
@@ -58,26 +128,23 @@ def extract_unique_event_ids(market_data_dir):
     jsonl_files = list(market_data_path.glob('markets_offset_*.jsonl'))
     logging.info(f"Found {len(jsonl_files)} potential market data files.")
 
+    # Preference order: simdjson (only the 'events' ids are materialized) -> orjson -> json
+    if simdjson:
+        parse_line = simdjson.Parser().parse
+    elif orjson:
+        parse_line = orjson.loads
+    else:
+        parse_line = json.loads
+
     for file_path in jsonl_files:
-        logging.debug(f"Processing file: {file_path.name}")
+        logging.debug("Processing file: %s", file_path.name)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
+            # Binary mode: all three parsers accept bytes and tolerate the trailing newline
+            with open(file_path, 'rb', buffering=1 << 20) as f:
                 for line_num, line in enumerate(f, 1):
                     try:
-                        market_data = json.loads(line.strip())
-                        # Check if 'events' key exists and is a list
-                        if isinstance(market_data.get('events'), list):
-                            for event in market_data['events']:
-                                # Check if event is a dict and has an 'id'
-                                if isinstance(event, dict) and 'id' in event:
-                                    event_ids.add(str(event['id'])) # Ensure ID is string
-                                else:
-                                     logging.warning(f"Skipping invalid event structure in {file_path.name}, line {line_num}: {event}")
-                        # Allow markets without an 'events' array or where it's not a list
-                        elif 'events' in market_data:
-                             logging.debug(f"Market in {file_path.name}, line {line_num} has non-list 'events' field: {type(market_data.get('events'))}")
-
-                    except json.JSONDecodeError as e:
+                        _add_line_event_ids(parse_line, line, event_ids, file_path.name, line_num)
+                    except ValueError as e: # json/orjson JSONDecodeError and simdjson errors
                         logging.error(f"JSON decode error in {file_path.name}, line {line_num}: {e}")
                     except Exception as e:
                          logging.error(f"Unexpected error processing line {line_num} in {file_path.name}: {e}")
@@ -90,15 +157,30 @@ def extract_unique_event_ids(market_data_dir):
     logging.info(f"Extracted {len(event_ids)} unique event IDs.")
     return event_ids
 
+def list_downloaded_event_ids(output_dir):
+    """
+    Returns the IDs of the non-empty event_{id}.json files in output_dir.
+
+    One os.scandir pass replaces the exists() + stat() pair previously issued
+    per event ID, and only files that are actually present get stat'ed.
+    """
+    downloaded_ids = set()
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith("event_") and name.endswith(".json") and entry.stat().st_size > 0:
+                downloaded_ids.add(name[len("event_"):-len(".json")])
+    return downloaded_ids
+
 def fetch_event_details(event_id):
     """Fetches details for a single event from the API."""
     url = f"{GAMMA_API_BASE_URL}/events/{event_id}"
-    logging.debug(f"Fetching details for event ID: {event_id} from {url}")
+    logging.debug("Fetching details for event ID: %s from %s", event_id, url)
     try:
-        response = requests.get(url, timeout=30)
+        response = SESSION.get(url, timeout=30)
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
-        logging.debug(f"Successfully fetched details for event ID: {event_id}")
+        data = orjson.loads(response.content) if orjson else response.json()
+        logging.debug("Successfully fetched details for event ID: %s", event_id)
         return data
     except requests.exceptions.Timeout:
         logging.error(f"Timeout error fetching event ID {event_id}")
@@ -114,7 +196,15 @@ def fetch_event_details(event_id):
         logging.error(f"Unexpected error fetching event {event_id}: {e}")
         return None
 
-def save_event_details(event_data, output_dir):
+def dump_json_bytes(data, pretty=False):
+    """Serializes data to UTF-8 JSON bytes; compact unless pretty is set."""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def save_event_details(event_data, output_dir, pretty=False):
     """Saves event detail data to a JSON file using a temp file."""
     if not event_data or not isinstance(event_data, dict) or 'id' not in event_data:
         logging.error(f"Invalid event data received, cannot save: {event_data}")
@@ -129,12 +219,12 @@ def save_event_details(event_data, output_dir):
         # Ensure output directory exists
         output_path.mkdir(parents=True, exist_ok=True)
 
-        with open(temp_filename, 'w', encoding='utf-8') as f:
-            json.dump(event_data, f, ensure_ascii=False, indent=4) # Indent for readability
+        with open(temp_filename, 'wb') as f:
+            f.write(dump_json_bytes(event_data, pretty))
 
-        # Rename temp file to final name after successful write
-        os.rename(temp_filename, final_filename)
-        logging.debug(f"Successfully saved event details to {final_filename}")
+        # Replace final file with temp file after successful write (atomic, also on Windows)
+        os.replace(temp_filename, final_filename)
+        logging.debug("Successfully saved event details to %s", final_filename)
         return True
     except IOError as e:
         logging.error(f"Error writing event file {temp_filename} or renaming to {final_filename}: {e}")
@@ -151,22 +241,94 @@ def save_event_details(event_data, output_dir):
     return False
 
 # --- Worker Function ---
-def fetch_and_save_event(event_id, output_dir):
+def fetch_and_save_event(event_id, output_dir, pretty=False):
     """Worker function to fetch and save details for a single event."""
-    logging.debug(f"Worker started for event ID: {event_id}")
+    logging.debug("Worker started for event ID: %s", event_id)
     event_details = fetch_event_details(event_id)
     if event_details is None:
         logging.error(f"Worker failed to fetch event ID {event_id}")
         return event_id, "fetch_error"
 
-    save_successful = save_event_details(event_details, output_dir)
+    save_successful = save_event_details(event_details, output_dir, pretty)
     if save_successful:
-        logging.debug(f"Worker successfully saved event ID {event_id}")
+        logging.debug("Worker successfully saved event ID %s", event_id)
         return event_id, "success"
     else:
         logging.error(f"Worker failed to save event ID {event_id}")
         return event_id, "save_error"
 
+def record_result(outcomes, needed_count, event_id, status):
+    """Appends event_id to outcomes[status] and logs download progress."""
+    outcomes[status].append(event_id)
+    message = f"Completed {len(outcomes['success'])}/{needed_count} ({status}) ID: {event_id}"
+    if status == "success":
+        logging.info(message)
+    else:
+        logging.warning(message)
+
+# --- Async Download (httpx) ---
+async def fetch_event_details_async(client, event_id):
+    """Async version of fetch_event_details using a shared httpx.AsyncClient."""
+    url = f"{GAMMA_API_BASE_URL}/events/{event_id}"
+    logging.debug("Fetching details for event ID: %s from %s", event_id, url)
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            response = await client.get(url)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                break
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+        response.raise_for_status()
+        data = orjson.loads(response.content) if orjson else response.json()
+        logging.debug("Successfully fetched details for event ID: %s", event_id)
+        return data
+    except httpx.TimeoutException:
+        logging.error(f"Timeout error fetching event ID {event_id}")
+        return None
+    except httpx.HTTPError as e:
+        logging.error(f"Network or HTTP error fetching event ID {event_id}: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON for event ID {event_id}: {e}")
+        logging.error(f"Response text (first 500 chars): {response.text[:500]}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error fetching event {event_id}: {e}")
+        return None
+
+async def fetch_and_save_event_async(client, semaphore, event_id, output_dir, pretty=False):
+    """Async worker: fetches one event and saves it on a thread so the event loop is not blocked."""
+    try:
+        async with semaphore:
+            event_details = await fetch_event_details_async(client, event_id)
+        if event_details is None:
+            logging.error(f"Worker failed to fetch event ID {event_id}")
+            return event_id, "fetch_error"
+
+        save_successful = await asyncio.to_thread(save_event_details, event_details, output_dir, pretty)
+        if save_successful:
+            logging.debug("Worker successfully saved event ID %s", event_id)
+            return event_id, "success"
+        logging.error(f"Worker failed to save event ID {event_id}")
+        return event_id, "save_error"
+    except Exception as exc:
+        logging.error(f"Event ID {event_id} generated an exception: {exc}")
+        return event_id, "fetch_error" # Assume fetch error if exception in worker
+
+async def download_events_async(event_ids, output_dir, concurrency, on_result, pretty=False):
+    """
+    Fetches and saves all event_ids with up to `concurrency` requests in flight,
+    calling on_result(event_id, status) as each one completes.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # Transport-level retries cover connection failures; status retries are in fetch_event_details_async
+    transport = httpx.AsyncHTTPTransport(retries=MAX_RETRIES, http2=HTTP2_AVAILABLE, limits=limits)
+    async with httpx.AsyncClient(transport=transport, timeout=30) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [fetch_and_save_event_async(client, semaphore, event_id, output_dir, pretty) for event_id in event_ids]
+        for next_done in asyncio.as_completed(tasks):
+            event_id, status = await next_done
+            on_result(event_id, status)
+
 # --- Main Execution ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Download event details from Polymarket Gamma API in parallel.")
@@ -179,7 +341,11 @@ if __name__ == "__main__":
     parser.add_argument("--sleep-time", type=float, default=DEFAULT_SLEEP_TIME,
                         help=f"Seconds to sleep between API requests (less relevant with parallel execution).")
     parser.add_argument("--workers", type=int, default=NUM_WORKERS,
-                        help=f"Number of parallel download workers (default: {NUM_WORKERS}).")
+                        help=f"Number of parallel download workers (default: {NUM_WORKERS}). The async downloader keeps {ASYNC_CONCURRENCY_PER_WORKER}x this many requests in flight.")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent the saved event JSON files for human inspection (default: compact).")
+    parser.add_argument("--use-threads", action="store_true",
+                        help="Use the threaded requests downloader even if httpx is installed.")
 
     args = parser.parse_args()
 
@@ -187,6 +353,8 @@ if __name__ == "__main__":
     logging.info("--- Starting Event Details Downloader Script ---")
     logging.info(f"Arguments: {vars(args)}")
 
+    configure_session(SESSION, args.workers * 2)
+
     output_path = Path(args.output_dir)
     # Ensure output directory exists *before* extraction, though save also checks
     output_path.mkdir(parents=True, exist_ok=True)
@@ -201,14 +369,9 @@ if __name__ == "__main__":
     logging.info(f"Found {len(unique_event_ids)} unique event IDs in source files.")
 
     # --- Phase 2: Filter IDs that need fetching ---
-    ids_to_fetch = []
-    skipped_count = 0
-    for event_id in unique_event_ids:
-        event_file_path = output_path / f"event_{event_id}.json"
-        if event_file_path.exists() and event_file_path.stat().st_size > 0:
-            skipped_count += 1
-        else:
-            ids_to_fetch.append(event_id)
+    downloaded_ids = list_downloaded_event_ids(output_path)
+    ids_to_fetch = [event_id for event_id in unique_event_ids if event_id not in downloaded_ids]
+    skipped_count = len(unique_event_ids) - len(ids_to_fetch)
 
     total_ids = len(unique_event_ids)
     needed_count = len(ids_to_fetch)
@@ -219,37 +382,33 @@ if __name__ == "__main__":
         exit()
 
     # --- Phase 3: Fetch and Save details in parallel ---
-    processed_count = 0
-    error_count = 0
-    fetch_errors = []
-    save_errors = []
-
-    logging.info(f"Starting parallel fetching with {args.workers} workers...")
-
-    # Use ThreadPoolExecutor for parallel execution
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
-        # Create a future for each ID to fetch
-        future_to_id = {executor.submit(fetch_and_save_event, event_id, args.output_dir): event_id for event_id in ids_to_fetch}
-
-        for future in concurrent.futures.as_completed(future_to_id):
-            event_id = future_to_id[future]
-            try:
-                _id, status = future.result()
-                if status == "success":
-                    processed_count += 1
-                    logging.info(f"Completed {processed_count}/{needed_count} ({status}) ID: {_id}")
-                elif status == "fetch_error":
-                    error_count += 1
-                    fetch_errors.append(_id)
-                    logging.warning(f"Completed {processed_count}/{needed_count} ({status}) ID: {_id}")
-                elif status == "save_error":
-                    error_count += 1
-                    save_errors.append(_id)
-                    logging.warning(f"Completed {processed_count}/{needed_count} ({status}) ID: {_id}")
-            except Exception as exc:
-                error_count += 1
-                fetch_errors.append(event_id) # Assume fetch error if exception in worker
-                logging.error(f"Event ID {event_id} generated an exception: {exc}")
+    outcomes = {"success": [], "fetch_error": [], "save_error": []}
+    on_result = functools.partial(record_result, outcomes, needed_count)
+
+    if httpx is not None and not args.use_threads:
+        concurrency = args.workers * ASYNC_CONCURRENCY_PER_WORKER
+        logging.info(f"Starting async fetching with up to {concurrency} concurrent requests (HTTP/2: {HTTP2_AVAILABLE})...")
+        asyncio.run(download_events_async(ids_to_fetch, args.output_dir, concurrency, on_result, args.pretty))
+    else:
+        logging.info(f"Starting parallel fetching with {args.workers} workers...")
+
+        # Use ThreadPoolExecutor for parallel execution
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            # Create a future for each ID to fetch
+            future_to_id = {executor.submit(fetch_and_save_event, event_id, args.output_dir, args.pretty): event_id for event_id in ids_to_fetch}
+
+            for future in concurrent.futures.as_completed(future_to_id):
+                event_id = future_to_id[future]
+                try:
+                    _id, status = future.result()
+                except Exception as exc:
+                    logging.error(f"Event ID {event_id} generated an exception: {exc}")
+                    _id, status = event_id, "fetch_error" # Assume fetch error if exception in worker
+                on_result(_id, status)
+
+    processed_count = len(outcomes["success"])
+    fetch_errors = outcomes["fetch_error"]
+    save_errors = outcomes["save_error"]
 
     logging.info("--- Event Details Downloader Script Finished ---")
     logging.info(f"Total unique IDs found: {total_ids}")
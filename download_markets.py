@@ -7,19 +7,31 @@ by scanning existing filenames in the output directory.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import argparse
 import logging
 import os
-import re
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
 # --- Constants ---
 GAMMA_API_BASE_URL = "https://gamma-api.polymarket.com"
 DEFAULT_LIMIT = 20
 DEFAULT_STATUS = 'closed'
 DEFAULT_SLEEP_TIME = 1.0 # Seconds between requests
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504] # Transient statuses retried with backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3 # Seconds; doubled on each retry
+MANIFEST_FILENAME = "_manifest.txt" # Holds the name of the last successfully saved batch file
+BATCH_FILENAME_PREFIX = "markets_offset_" # Batch files are named markets_offset_{offset}_limit_{limit}.jsonl
+BATCH_FILENAME_SUFFIX = ".jsonl"
 
 # --- Helper Functions ---
 def setup_logging(log_file_path):
@@ -42,23 +54,82 @@ def setup_logging(log_file_path):
     console_handler.setFormatter(log_formatter)
     root_logger.addHandler(console_handler)
 
+def configure_session(session, pool_size):
+    """Mounts a pooled HTTPS adapter with retry/backoff on transient errors onto the session."""
+    retry = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+# Batches are fetched one after another, so a single kept-alive connection is enough
+SESSION = configure_session(requests.Session(), 1)
+
+def parse_batch_offset(filename):
+    """Returns the offset of a markets_offset_{offset}_limit_{limit}.jsonl file name, or None for any other name."""
+    if not (filename.startswith(BATCH_FILENAME_PREFIX) and filename.endswith(BATCH_FILENAME_SUFFIX)):
+        return None
+    # Plain string slicing is enough for the fixed name format and cheaper than a regex per file
+    offset_str, sep, limit_str = filename[len(BATCH_FILENAME_PREFIX):-len(BATCH_FILENAME_SUFFIX)].partition('_limit_')
+    if sep and offset_str.isdecimal() and limit_str.isdecimal():
+        return int(offset_str)
+    return None
+
+def read_manifest(output_dir):
+    """
+    Returns the offset of the last saved batch recorded in the manifest, or
+    None if there is no manifest or the batch file it names is missing/empty.
+    """
+    try:
+        with open(output_dir / MANIFEST_FILENAME, 'r', encoding='utf-8') as f:
+            last_batch_name = f.read().strip()
+        offset = parse_batch_offset(last_batch_name)
+        if offset is not None and os.stat(output_dir / last_batch_name).st_size > 0:
+            return offset
+    except OSError:
+        pass
+    return None
+
+def write_manifest(output_dir, batch_filename):
+    """Records batch_filename as the last saved batch (temp file + os.replace, so never half-written)."""
+    manifest_path = output_dir / MANIFEST_FILENAME
+    temp_path = manifest_path.with_suffix('.txt.tmp')
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(f"{batch_filename}\n")
+        os.replace(temp_path, manifest_path)
+    except OSError as e:
+        # Not fatal: a stale manifest only makes the next run resume from an earlier batch
+        logging.warning(f"Could not update manifest {manifest_path}: {e}")
+
 def get_starting_offset(output_dir, limit):
-    """Scans output directory for saved batch files to determine starting offset."""
+    """
+    Determines the starting offset from the manifest, falling back to scanning
+    the output directory for saved batch files (and rebuilding the manifest).
+    """
+    manifest_offset = read_manifest(output_dir)
+    if manifest_offset is not None:
+        starting_offset = manifest_offset + limit
+        logging.info(f"Determined starting offset: {starting_offset} (from manifest, last saved offset: {manifest_offset})")
+        return starting_offset
+
     max_saved_offset = -limit # Start from offset 0 if no files found
-    # Revert back to raw string for regex
-    pattern = re.compile(r"markets_offset_(\d+)_limit_\d+\.jsonl")
+    last_batch_name = None
     try:
         if output_dir.exists():
-            for filename in output_dir.iterdir():
-                match = pattern.match(filename.name)
-                if match:
-                    offset = int(match.group(1))
-                    # Check if file has content (simple check)
-                    if filename.stat().st_size > 0:
-                         max_saved_offset = max(max_saved_offset, offset)
-                    else:
-                        logging.warning(f"Found empty or potentially incomplete file: {filename.name}. Ignoring for offset calculation.")
-
+            with os.scandir(output_dir) as it:
+                for entry in it:
+                    offset = parse_batch_offset(entry.name)
+                    if offset is not None:
+                        # Check if file has content (simple check)
+                        if entry.stat().st_size > 0:
+                            if offset > max_saved_offset:
+                                max_saved_offset = offset
+                                last_batch_name = entry.name
+                        else:
+                            logging.warning(f"Found empty or potentially incomplete file: {entry.name}. Ignoring for offset calculation.")
+
+        if last_batch_name:
+            write_manifest(output_dir, last_batch_name) # Next startup reads this instead of scanning
 
         starting_offset = max_saved_offset + limit
         logging.info(f"Determined starting offset: {starting_offset} (based on max saved offset: {max_saved_offset})")
@@ -93,9 +164,9 @@ def fetch_markets_batch(offset, limit, status_filter, date_filters):
 
     logging.info(f"Fetching batch: offset={offset}, limit={limit}, params={params}")
     try:
-        response = requests.get(url, params=params, timeout=30) # Added timeout
+        response = SESSION.get(url, params=params, timeout=30) # Added timeout
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
+        data = orjson.loads(response.content) if orjson else response.json()
         logging.info(f"Received {len(data)} markets for offset {offset}.")
         return data
     except requests.exceptions.RequestException as e:
@@ -106,6 +177,22 @@ def fetch_markets_batch(offset, limit, status_filter, date_filters):
         logging.error(f"Response text (first 500 chars): {response.text[:500]}")
         return None
 
+def fsync_directory(dir_path):
+    """Flushes a directory entry change (e.g. a rename into dir_path) to disk; no-op where unsupported (Windows)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def dump_json_bytes(data):
+    """Serializes data to compact UTF-8 JSON bytes."""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 def save_batch_jsonl(batch_data, output_dir, offset, limit):
     """Saves a batch of market data to a JSON Lines file using a temp file."""
     if not batch_data:
@@ -116,16 +203,16 @@ def save_batch_jsonl(batch_data, output_dir, offset, limit):
     temp_filename = final_filename.with_suffix('.jsonl.tmp')
 
     try:
-        with open(temp_filename, 'w', encoding='utf-8') as f:
-            for market in batch_data:
-                # Ensure each market is written as a single line
-                json.dump(market, f, ensure_ascii=False)
-                f.write('\n')
-
-        # Rename temp file to final name after successful write
-        os.rename(temp_filename, final_filename)
-        logging.info(f"Successfully saved batch to {final_filename}")
-        return True
+        # Serialize the whole batch first (one market per line) and write it in one call
+        payload = b'\n'.join([dump_json_bytes(market) for market in batch_data]) + b'\n'
+        with open(temp_filename, 'wb') as f:
+            f.write(payload)
+            # Make sure the data is on disk before the rename makes the batch count as saved
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Replace final file with temp file after successful write (atomic, also on Windows)
+        os.replace(temp_filename, final_filename)
     except IOError as e:
         logging.error(f"Error writing batch file {temp_filename} or renaming to {final_filename}: {e}")
         # Attempt to clean up temp file if it exists
@@ -139,6 +226,16 @@ def save_batch_jsonl(batch_data, output_dir, offset, limit):
         logging.error(f"An unexpected error occurred during saving batch offset {offset}: {e}")
         return False
 
+    # Persist the rename itself, so a crash cannot leave the batch missing after it was reported saved
+    try:
+        fsync_directory(output_dir)
+    except OSError as e:
+        # The batch is already in place; only its durability across a crash is not guaranteed
+        logging.warning(f"Could not fsync directory {output_dir} after saving {final_filename.name}: {e}")
+    logging.info(f"Successfully saved batch to {final_filename}")
+    write_manifest(output_dir, final_filename.name)
+    return True
+
 
 # --- Main Execution ---
 if __name__ == "__main__":
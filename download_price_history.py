@@ -1,7 +1,8 @@
 """
 Script to download price history time series data from the Polymarket CLOB API.
 
-Scans market detail JSON files (market_{id}.json) to extract the market ID
+Scans market detail JSON files (market_{id}.json, loose or in the zip archives
+written by process_data.py --market-archive) to extract the market ID
 and the first CLOB token ID (assumed to be the 'Yes' outcome). Fetches the
 price history for that token ID using the /prices-history endpoint and saves
 the raw JSON response to a file (price_history_yes_{market_id}.json).
@@ -9,21 +10,65 @@ Resumes automatically by checking for existing price history files.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import argparse
 import logging
+import logging.handlers
 import os
-from pathlib import Path
 import concurrent.futures # For parallel execution
+import collections
+import asyncio
+import functools
+import importlib.util
+import contextlib
+import queue
+import threading
+import itertools
+import zipfile
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # Optional on-demand parser used by _parse_one
+    simdjson = None
+
+try:
+    import zstandard
+except ImportError:  # Only needed for --compress
+    zstandard = None
+
+try:
+    import httpx
+except ImportError:  # Without httpx the threaded requests downloader is used
+    httpx = None
+
+# httpx only negotiates HTTP/2 when the optional 'h2' package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
 
 # --- Constants ---
 # Note: Using the clob subdomain as specified in the example URL
 CLOB_API_BASE_URL = "https://clob.polymarket.com"
 DEFAULT_SLEEP_TIME = 0.1 # Reduced sleep as parallelism handles rate limiting better
 NUM_WORKERS = 8  # Number of parallel download threads
+PARSE_CHUNKSIZE = 256 # Market detail files per process-pool task in Phase 1, to amortize the IPC
 START_TS = 0 # Start timestamp for fetching history (beginning of time)
 END_TS = 2000000000 # End timestamp (far future, e.g., year 2033) to get all history
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504] # Transient statuses retried with backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3 # Seconds; doubled on each retry
+ASYNC_CONCURRENCY_PER_WORKER = 8 # In-flight requests per --workers in the async downloader
+ZSTD_LEVEL = 3 # zstd compression level for --compress
+PROGRESS_LOG_INTERVAL = 100 # Log a progress line every this many successful downloads
+SHARD_PREFIX = "price_history_shard_" # --shard-size output: price_history_shard_{k}.jsonl
+SHARD_INDEX_FILENAME = "price_history_index.tsv" # market_id, shard file, byte offset, length per sharded record
+ZSTD_SUFFIX = ".zst"
 
 # --- Helper Functions ---
 def setup_logging(log_file_path):
@@ -46,93 +91,195 @@ def setup_logging(log_file_path):
     console_handler.setFormatter(log_formatter)
     root_logger.addHandler(console_handler)
 
-def extract_market_and_token_ids(market_details_dir):
+    # httpx logs every request at INFO; keep the log to our own progress lines
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+@contextlib.contextmanager
+def queued_logging():
     """
-    Scans market details directory for market_*.json files and extracts
-    (market_id, first_clob_token_id) pairs.
+    Routes log records through a queue to the configured handlers while active.
+
+    Worker threads then only enqueue their records; a single listener thread
+    does the console/file writes, so workers don't contend for handler locks.
     """
-    market_token_pairs = []
-    market_details_path = Path(market_details_dir)
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers[:]
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop() # Writes out the remaining queued records
+        root_logger.handlers = handlers
+
+def configure_session(session, pool_size):
+    """Mounts a pooled HTTPS adapter with retry/backoff on transient errors onto the session."""
+    retry = Retry(total=MAX_RETRIES, backoff_factor=RETRY_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+# Shared by all worker threads so keep-alive connections are reused instead of
+# paying a new TCP+TLS handshake per market. Resized in main to match --workers.
+SESSION = configure_session(requests.Session(), NUM_WORKERS * 2)
+
+# One parser per process: Phase 1 workers parse one file at a time, and the
+# market_data proxies are released when _parse_one returns
+_SIMDJSON_PARSER = simdjson.Parser() if simdjson else None
+
+def _first_token_id(clob_token_ids_str):
+    """
+    Returns the first token ID of a clobTokenIds string such as '["123", "456"]'
+    by slicing, or None if the string doesn't have that exact shape (the caller
+    then parses it with json.loads).
+    """
+    if not (isinstance(clob_token_ids_str, str) and clob_token_ids_str.startswith('["')):
+        return None
+    end = clob_token_ids_str.find('"', 2)
+    # Token IDs are decimal numbers; anything else (escapes, other types) takes the JSON path
+    if end > 2 and clob_token_ids_str[2:end].isdecimal() and clob_token_ids_str[end + 1:end + 2] in (',', ']'):
+        return clob_token_ids_str[2:end]
+    return None
 
-    if not market_details_path.is_dir():
-        logging.error(f"Market details directory not found: {market_details_dir}")
-        return market_token_pairs
+def _parse_one(file_path):
+    """
+    Reads one market_{id}.json file and returns (outcome, market_id, first_token_id),
+    where outcome is "ok", "no_tokens" or "parse_error" (see _parse_market_json).
+    """
+    file_name = os.path.basename(file_path)
+    try:
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+    except IOError as e:
+        logging.error(f"Could not read file {file_name}: {e}")
+        return "parse_error", file_name[len('market_'):-len('.json')], None
+    return _parse_market_json(file_name, raw)
 
-    logging.info(f"Scanning directory for market detail files: {market_details_dir}")
-    json_files = list(market_details_path.glob('market_*.json'))
-    logging.info(f"Found {len(json_files)} potential market detail files.")
+def _parse_archive(archive_path):
+    """
+    Parses the market_{id}.json entries of one process_data.py --market-archive
+    zip archive; returns a list of _parse_market_json results.
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return [_parse_market_json(name, archive.read(name)) for name in archive.namelist()
+                    if name.startswith('market_') and name.endswith('.json')]
+    except (IOError, zipfile.BadZipFile) as e:
+        logging.error(f"Could not read market archive {os.path.basename(archive_path)}: {e}")
+        return [("parse_error", None, None)]
+
+def _parse_market_json(file_name, raw):
+    """
+    Parses the bytes of the market_{id}.json file file_name and returns
+    (outcome, market_id, first_token_id), where outcome is "ok", "no_tokens"
+    or "parse_error".
 
-    processed_files = 0
-    skipped_files_no_tokens = 0
-    skipped_files_parse_error = 0
+    With simdjson only 'clobTokenIds' is materialized; the rest of the
+    (often large) market record is never converted to Python objects.
+    """
+    logging.debug("Processing file: %s", file_name)
+    market_id = file_name[len('market_'):-len('.json')] # Extract ID from filename market_{id}.json
 
-    for file_path in json_files:
-        logging.debug(f"Processing file: {file_path.name}")
-        market_id = file_path.stem.split('_')[-1] # Extract ID from filename market_{id}
-        first_token_id = None
+    try:
+        # Preference order: simdjson -> orjson -> json
+        if _SIMDJSON_PARSER:
+            market_data = _SIMDJSON_PARSER.parse(raw)
+        else:
+            market_data = orjson.loads(raw) if orjson else json.loads(raw)
+        clob_token_ids_str = market_data.get('clobTokenIds')
+
+        if not clob_token_ids_str:
+            logging.debug("Skipping %s: 'clobTokenIds' field is missing or empty.", file_name)
+            return "no_tokens", market_id, None
+
+        first_token_id = _first_token_id(clob_token_ids_str)
+        if first_token_id is not None:
+            return "ok", market_id, first_token_id
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                market_data = json.load(f)
-                clob_token_ids_str = market_data.get('clobTokenIds')
+            # Parse the string representation of the list
+            token_list = json.loads(clob_token_ids_str)
+            if isinstance(token_list, list) and len(token_list) > 0:
+                return "ok", market_id, str(token_list[0]) # Take the first one, ensure string
+            logging.warning(f"Skipping {file_name}: 'clobTokenIds' did not contain a valid list or was empty after parsing. Content: {clob_token_ids_str}")
+        except json.JSONDecodeError:
+            logging.error(f"Skipping {file_name}: Could not parse 'clobTokenIds' JSON string: {clob_token_ids_str}")
+        except Exception as parse_e:
+            logging.error(f"Skipping {file_name}: Unexpected error parsing 'clobTokenIds': {parse_e}. Content: {clob_token_ids_str}")
+        return "no_tokens", market_id, None
+
+    except ValueError as e: # json/orjson JSONDecodeError and simdjson errors
+        logging.error(f"JSON decode error reading file {file_name}: {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error processing file {file_name}: {e}")
+    return "parse_error", market_id, None
 
-                if not clob_token_ids_str:
-                    logging.debug(f"Skipping {file_path.name}: 'clobTokenIds' field is missing or empty.")
-                    skipped_files_no_tokens += 1
-                    continue
+def extract_market_and_token_ids(market_details_dir, log_file_path):
+    """
+    Scans market details directory for market_*.json files (and markets_*.zip
+    archives of them) and extracts (market_id, first_clob_token_id) pairs.
 
-                try:
-                    # Parse the string representation of the list
-                    token_list = json.loads(clob_token_ids_str)
-                    if isinstance(token_list, list) and len(token_list) > 0:
-                        first_token_id = str(token_list[0]) # Take the first one, ensure string
-                    else:
-                        logging.warning(f"Skipping {file_path.name}: 'clobTokenIds' did not contain a valid list or was empty after parsing. Content: {clob_token_ids_str}")
-                        skipped_files_no_tokens += 1
-                        continue
-                except json.JSONDecodeError:
-                    logging.error(f"Skipping {file_path.name}: Could not parse 'clobTokenIds' JSON string: {clob_token_ids_str}")
-                    skipped_files_no_tokens += 1
-                    continue
-                except Exception as parse_e:
-                     logging.error(f"Skipping {file_path.name}: Unexpected error parsing 'clobTokenIds': {parse_e}. Content: {clob_token_ids_str}")
-                     skipped_files_no_tokens += 1
-                     continue
-
-            # If we got a token ID, add the pair
-            if first_token_id:
+    The files are listed with a single os.scandir pass and parsed on a process
+    pool, so the JSON parsing of thousands of files is not serialized by the GIL;
+    each archive is one task. Worker processes log to log_file_path as well.
+    """
+    market_token_pairs = []
+
+    if not os.path.isdir(market_details_dir):
+        logging.error(f"Market details directory not found: {market_details_dir}")
+        return market_token_pairs
+
+    logging.info(f"Scanning directory for market detail files: {market_details_dir}")
+    json_files = []
+    archive_files = []
+    with os.scandir(market_details_dir) as it:
+        for entry in it:
+            if entry.name.startswith('market_') and entry.name.endswith('.json'):
+                json_files.append(entry.path)
+            elif entry.name.startswith('markets_') and entry.name.endswith('.zip'):
+                archive_files.append(entry.path)
+    logging.info(f"Found {len(json_files)} potential market detail files.")
+    if archive_files:
+        logging.info(f"Found {len(archive_files)} market detail archives.")
+
+    outcome_counts = collections.Counter()
+    seen_market_ids = set() # A market can be both a loose file and in an archive; the loose file (listed first) wins
+    # Workers started with spawn/forkserver don't inherit the logging setup, so configure it in each
+    with concurrent.futures.ProcessPoolExecutor(initializer=setup_logging, initargs=(log_file_path,)) as executor:
+        results = itertools.chain(executor.map(_parse_one, json_files, chunksize=PARSE_CHUNKSIZE),
+                                  itertools.chain.from_iterable(executor.map(_parse_archive, archive_files)))
+        for outcome, market_id, first_token_id in results:
+            if market_id is not None and market_id in seen_market_ids:
+                outcome_counts["duplicate"] += 1
+                continue
+            seen_market_ids.add(market_id)
+            outcome_counts[outcome] += 1
+            if outcome == "ok":
                 market_token_pairs.append((market_id, first_token_id))
-                processed_files += 1
-
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error reading file {file_path.name}: {e}")
-            skipped_files_parse_error += 1
-        except IOError as e:
-            logging.error(f"Could not read file {file_path.name}: {e}")
-            skipped_files_parse_error += 1
-        except Exception as e:
-            logging.error(f"Unexpected error processing file {file_path.name}: {e}")
-            skipped_files_parse_error += 1
-
-    logging.info(f"Successfully extracted token IDs for {processed_files} markets.")
-    if skipped_files_no_tokens > 0:
-        logging.warning(f"Skipped {skipped_files_no_tokens} files due to missing/invalid 'clobTokenIds'.")
-    if skipped_files_parse_error > 0:
-        logging.warning(f"Skipped {skipped_files_parse_error} files due to JSON read/parse errors.")
+
+    logging.info(f"Successfully extracted token IDs for {outcome_counts['ok']} markets.")
+    if outcome_counts["no_tokens"] > 0:
+        logging.warning(f"Skipped {outcome_counts['no_tokens']} files due to missing/invalid 'clobTokenIds'.")
+    if outcome_counts["parse_error"] > 0:
+        logging.warning(f"Skipped {outcome_counts['parse_error']} files due to JSON read/parse errors.")
+    if outcome_counts["duplicate"] > 0:
+        logging.info(f"Skipped {outcome_counts['duplicate']} markets found both as a file and in an archive (or in several archives).")
 
     return market_token_pairs
 
 def fetch_price_history(clob_token_id):
     """Fetches price history for a single CLOB token ID."""
     url = f"{CLOB_API_BASE_URL}/prices-history?market={clob_token_id}&startTs={START_TS}&endTs={END_TS}"
-    logging.debug(f"Fetching price history for token ID: {clob_token_id}") # Don't log full URL to avoid large token IDs in logs
+    logging.debug("Fetching price history for token ID: %s", clob_token_id) # Don't log full URL to avoid large token IDs in logs
     try:
-        response = requests.get(url, timeout=60) # Increased timeout for potentially large history
+        response = SESSION.get(url, timeout=60) # Increased timeout for potentially large history
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content) if orjson else response.json()
         # Basic validation of response structure
         if isinstance(data, dict) and 'history' in data and isinstance(data['history'], list):
-            logging.debug(f"Successfully fetched price history for token ID: {clob_token_id}. Records: {len(data['history'])}")
+            logging.debug("Successfully fetched price history for token ID: %s. Records: %s", clob_token_id, len(data['history']))
             return data
         else:
              logging.error(f"Invalid JSON structure received for token ID {clob_token_id}. Missing 'history' list. Response: {str(data)[:500]}")
@@ -155,24 +302,49 @@ def fetch_price_history(clob_token_id):
         logging.error(f"Unexpected error fetching price history for token {clob_token_id}: {e}")
         return None
 
-def save_price_history(price_data, market_id, output_dir):
-    """Saves price history data to a JSON file using a temp file."""
+def fsync_directory(dir_path):
+    """Flushes a directory entry change (e.g. a rename into dir_path) to disk; no-op where unsupported (Windows)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def dump_json_bytes(data):
+    """Serializes data to compact UTF-8 JSON bytes."""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def save_price_history(price_data, market_id, output_dir, compress=False):
+    """Saves price history data to a JSON file (zstd-compressed .json.zst if compress) using a temp file."""
     if not price_data or not isinstance(price_data, dict) or 'history' not in price_data:
         logging.error(f"Invalid price data received for market {market_id}, cannot save: {price_data}")
         return False
 
-    output_path = Path(output_dir)
-    final_filename = output_path / f"price_history_yes_{market_id}.json"
-    temp_filename = final_filename.with_suffix('.json.tmp')
+    # Plain string paths: this runs once per market, so skip building Path objects
+    final_filename = os.path.join(output_dir, f"price_history_yes_{market_id}.json{ZSTD_SUFFIX if compress else ''}")
+    temp_filename = final_filename + '.tmp'
 
     try:
-        output_path.mkdir(parents=True, exist_ok=True)
-        with open(temp_filename, 'w', encoding='utf-8') as f:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(temp_filename, 'wb') as f:
             # Save raw JSON, no indentation needed for potentially large data
-            json.dump(price_data, f, ensure_ascii=False)
-
-        os.rename(temp_filename, final_filename)
-        logging.debug(f"Successfully saved price history to {final_filename}")
+            payload = dump_json_bytes(price_data)
+            if compress:
+                # Timestamp/price series are very repetitive; zstd shrinks them several times over
+                payload = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Replace final file with temp file after successful write (atomic, also on Windows)
+        os.replace(temp_filename, final_filename)
+        # Persist the rename itself, so a crash cannot leave the file missing after it was reported saved
+        fsync_directory(output_dir)
+        logging.debug("Successfully saved price history to %s", final_filename)
         return True
     except IOError as e:
         logging.error(f"Error writing price history file {temp_filename} or renaming to {final_filename}: {e}")
@@ -180,7 +352,7 @@ def save_price_history(price_data, market_id, output_dir):
         logging.error(f"An unexpected error occurred during saving price history for market ID {market_id}: {e}")
 
     # Attempt to clean up temp file if it exists and saving failed
-    if temp_filename.exists():
+    if os.path.exists(temp_filename):
         try:
             os.remove(temp_filename)
             logging.warning(f"Removed temporary file {temp_filename} after save error.")
@@ -188,47 +360,267 @@ def save_price_history(price_data, market_id, output_dir):
             logging.error(f"Could not remove temporary file {temp_filename}: {remove_e}")
     return False
 
+def list_downloaded_market_ids(output_dir):
+    """
+    Returns the set of market IDs that already have a price history file
+    (.json or .json.zst) in output_dir, from a single directory listing, or
+    an entry in the shard index (--shard-size).
+
+    Empty files don't count: files written now are fsynced before being renamed
+    into place, but older versions of this script wrote them without fsync, so a
+    crash could leave zero-byte files behind, which are downloaded again.
+    """
+    prefix = 'price_history_yes_'
+    done_ids = set()
+    try:
+        with open(os.path.join(output_dir, SHARD_INDEX_FILENAME), 'r', encoding='utf-8') as index_file:
+            done_ids.update(line.split('\t', 1)[0] for line in index_file if line.strip())
+    except FileNotFoundError:
+        pass # Not a sharded download
+    with os.scandir(output_dir) as it:
+        for entry in it:
+            name = entry.name
+            if not name.startswith(prefix) or entry.stat().st_size == 0:
+                continue
+            if name.endswith('.json'):
+                done_ids.add(name[len(prefix):-len('.json')])
+            elif name.endswith('.json' + ZSTD_SUFFIX):
+                done_ids.add(name[len(prefix):-len('.json' + ZSTD_SUFFIX)])
+    return done_ids
+
+class ShardWriter:
+    """
+    Appends price histories to price_history_shard_{k}.jsonl files of up to
+    shard_size records each (--shard-size), instead of one file per market.
+
+    Each line is {"id": market_id, "data": price_data}. A shard's records are
+    added to SHARD_INDEX_FILENAME (market_id, shard file, byte offset, length)
+    only once the shard is complete and fsynced, so every indexed record is
+    intact; records of a shard cut short by a crash are downloaded again.
+    Safe to call from several threads.
+    """
+
+    def __init__(self, output_dir, shard_size):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        self.next_shard = self._first_free_shard_number()
+        self.shard_file = None
+        self.shard_name = None
+        self.pending_index_lines = []
+
+    def _first_free_shard_number(self):
+        """New shards never reuse a number, so unindexed leftovers of a crash are never appended to."""
+        last_shard = -1
+        with os.scandir(self.output_dir) as it:
+            for entry in it:
+                name = entry.name
+                if name.startswith(SHARD_PREFIX) and name.endswith('.jsonl') and name[len(SHARD_PREFIX):-len('.jsonl')].isdecimal():
+                    last_shard = max(last_shard, int(name[len(SHARD_PREFIX):-len('.jsonl')]))
+        return last_shard + 1
+
+    def add(self, price_data, market_id):
+        """Appends one market's price history; returns True on success (same contract as save_price_history)."""
+        line = dump_json_bytes({"id": market_id, "data": price_data}) + b'\n'
+        with self.lock:
+            try:
+                if self.shard_file is None:
+                    self.shard_name = f"{SHARD_PREFIX}{self.next_shard}.jsonl"
+                    self.next_shard += 1
+                    self.shard_file = open(os.path.join(self.output_dir, self.shard_name), 'wb')
+                offset = self.shard_file.tell()
+                self.shard_file.write(line)
+                self.pending_index_lines.append(f"{market_id}\t{self.shard_name}\t{offset}\t{len(line)}\n")
+                if len(self.pending_index_lines) >= self.shard_size:
+                    self._finish_shard()
+                return True
+            except OSError as e:
+                logging.error(f"Error writing price history for market ID {market_id} to shard {self.shard_name}: {e}")
+                return False
+
+    def _finish_shard(self):
+        """
+        Fsyncs and closes the current shard, then indexes its records. Called with self.lock held.
+        The shard's index lines are taken off the queue first: if any step raises OSError they
+        are dropped, never written with a later shard, so its markets are downloaded again on resume.
+        """
+        shard_file, self.shard_file = self.shard_file, None
+        index_lines, self.pending_index_lines = self.pending_index_lines, []
+        try:
+            with shard_file:
+                shard_file.flush()
+                os.fsync(shard_file.fileno())
+            fsync_directory(self.output_dir)
+            with open(os.path.join(self.output_dir, SHARD_INDEX_FILENAME), 'a', encoding='utf-8') as index_file:
+                index_file.write(''.join(index_lines))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+        except OSError:
+            logging.error(f"Dropped the {len(index_lines)} price histories of shard {self.shard_name}; "
+                          f"they will be downloaded again on the next run.")
+            raise
+        logging.info(f"Finished shard {self.shard_name} with {len(index_lines)} price histories.")
+
+    def close(self):
+        """Finishes the last, partially filled shard."""
+        with self.lock:
+            if self.shard_file is not None:
+                self._finish_shard()
+
+def save_market_price_history(price_data, market_id, output_dir, compress, shard_writer):
+    """Saves one market's price history to its own file, or to the current shard if sharding is on."""
+    if shard_writer is not None:
+        return shard_writer.add(price_data, market_id)
+    return save_price_history(price_data, market_id, output_dir, compress)
+
 # --- Worker Function ---
-def fetch_and_save_price_history(market_id, clob_token_id, output_dir):
+def fetch_and_save_price_history(market_id, clob_token_id, output_dir, compress=False, shard_writer=None):
     """Worker function to fetch and save price history for a single market."""
-    logging.debug(f"Worker started for market ID: {market_id} (token: {clob_token_id})")
+    logging.debug("Worker started for market ID: %s (token: %s)", market_id, clob_token_id)
     price_history_data = fetch_price_history(clob_token_id)
     if price_history_data is None:
         # Fetch error includes cases like 404 where data might legitimately not exist
         logging.warning(f"Worker did not fetch or received invalid price history for market {market_id} (token: {clob_token_id})")
         return market_id, "fetch_error_or_no_data" # Treat 404 or bad data as a fetch issue for retry logic
 
-    save_successful = save_price_history(price_history_data, market_id, output_dir)
+    save_successful = save_market_price_history(price_history_data, market_id, output_dir, compress, shard_writer)
     if save_successful:
-        logging.debug(f"Worker successfully saved price history for market ID {market_id}")
+        logging.debug("Worker successfully saved price history for market ID %s", market_id)
         return market_id, "success"
     else:
         logging.error(f"Worker failed to save price history for market ID {market_id}")
         return market_id, "save_error"
 
+def record_result(outcomes, needed_count, market_id, status):
+    """
+    Appends market_id to outcomes[status] and logs download progress.
+
+    Errors are logged for every market; successes only every
+    PROGRESS_LOG_INTERVAL markets (and for the last one).
+    """
+    outcomes[status].append(market_id)
+    processed = sum(len(ids) for ids in outcomes.values())
+    progress_percent = (processed / needed_count) * 100 if needed_count > 0 else 0
+    if status == "success":
+        if processed % PROGRESS_LOG_INTERVAL == 0 or processed == needed_count:
+            logging.info("Progress: %d/%d (%.1f%%) - Success   - Market ID: %s", processed, needed_count, progress_percent, market_id)
+    elif status == "fetch_error_or_no_data":
+        logging.warning("Progress: %d/%d (%.1f%%) - Fetch Err - Market ID: %s", processed, needed_count, progress_percent, market_id)
+    elif status == "save_error":
+        logging.error("Progress: %d/%d (%.1f%%) - Save Err  - Market ID: %s", processed, needed_count, progress_percent, market_id)
+
+# --- Async Download (httpx) ---
+async def fetch_price_history_async(client, clob_token_id):
+    """Async version of fetch_price_history using a shared httpx.AsyncClient."""
+    url = f"{CLOB_API_BASE_URL}/prices-history?market={clob_token_id}&startTs={START_TS}&endTs={END_TS}"
+    logging.debug("Fetching price history for token ID: %s", clob_token_id)
+    try:
+        # Back off and retry on rate limiting (429) and transient server errors
+        for attempt in range(MAX_RETRIES + 1):
+            response = await client.get(url)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                break
+            await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+        response.raise_for_status()
+        data = orjson.loads(response.content) if orjson else response.json()
+        if isinstance(data, dict) and 'history' in data and isinstance(data['history'], list):
+            logging.debug("Successfully fetched price history for token ID: %s. Records: %s", clob_token_id, len(data['history']))
+            return data
+        else:
+             logging.error(f"Invalid JSON structure received for token ID {clob_token_id}. Missing 'history' list. Response: {str(data)[:500]}")
+             return None
+    except httpx.TimeoutException:
+        logging.error(f"Timeout error fetching price history for token ID {clob_token_id}")
+        return None
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+             logging.warning(f"404 Not Found fetching price history for token ID {clob_token_id}. May not have history.")
+        else:
+             logging.error(f"Network or HTTP error fetching price history for token ID {clob_token_id}: {e}")
+        return None
+    except httpx.HTTPError as e:
+        logging.error(f"Network or HTTP error fetching price history for token ID {clob_token_id}: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        logging.error(f"Error decoding JSON for price history, token ID {clob_token_id}: {e}")
+        logging.error(f"Response text (first 500 chars): {response.text[:500]}")
+        return None
+    except Exception as e:
+        logging.error(f"Unexpected error fetching price history for token {clob_token_id}: {e}")
+        return None
+
+async def fetch_and_save_price_history_async(client, semaphore, market_id, clob_token_id, output_dir, compress=False, shard_writer=None):
+    """Async worker: fetches one price history and saves it on a thread so the event loop is not blocked."""
+    try:
+        async with semaphore:
+            price_history_data = await fetch_price_history_async(client, clob_token_id)
+        if price_history_data is None:
+            logging.warning(f"Worker did not fetch or received invalid price history for market {market_id} (token: {clob_token_id})")
+            return market_id, "fetch_error_or_no_data"
+
+        save_successful = await asyncio.to_thread(save_market_price_history, price_history_data, market_id, output_dir, compress, shard_writer)
+        if save_successful:
+            logging.debug("Worker successfully saved price history for market ID %s", market_id)
+            return market_id, "success"
+        logging.error(f"Worker failed to save price history for market ID {market_id}")
+        return market_id, "save_error"
+    except Exception as exc:
+        logging.error(f"Market ID {market_id} generated an exception in worker: {exc}", exc_info=True)
+        return market_id, "fetch_error_or_no_data" # Count as fetch error if worker crashes
+
+async def download_price_histories_async(pairs_to_fetch, output_dir, concurrency, on_result, compress=False, shard_writer=None):
+    """
+    Fetches and saves the price history of every (market_id, token_id) pair with
+    up to `concurrency` requests in flight, calling on_result(market_id, status)
+    as each one completes.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # Transport-level retries cover connection failures; status retries are in fetch_price_history_async
+    transport = httpx.AsyncHTTPTransport(retries=MAX_RETRIES, http2=HTTP2_AVAILABLE, limits=limits)
+    async with httpx.AsyncClient(transport=transport, timeout=60) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [fetch_and_save_price_history_async(client, semaphore, market_id, token_id, output_dir, compress, shard_writer)
+                 for market_id, token_id in pairs_to_fetch]
+        for next_done in asyncio.as_completed(tasks):
+            market_id, status = await next_done
+            on_result(market_id, status)
+
 # --- Main Execution ---
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Download price history from Polymarket CLOB API in parallel.")
     parser.add_argument("--market-details-dir", type=str, required=True,
-                        help="Directory containing the market detail (market_{id}.json) files.")
+                        help="Directory containing the market detail (market_{id}.json) files, or process_data.py --market-archive archives of them.")
     parser.add_argument("--output-dir", type=str, required=True,
                         help="Directory to store the output price history JSON files (price_history_yes_{market_id}.json).")
     parser.add_argument("--log-file", type=str, default="price_history_downloader.log",
                         help="Path to the log file.")
     parser.add_argument("--workers", type=int, default=NUM_WORKERS,
-                        help=f"Number of parallel download workers (default: {NUM_WORKERS}).")
+                        help=f"Number of parallel download workers (default: {NUM_WORKERS}). The async downloader keeps {ASYNC_CONCURRENCY_PER_WORKER}x this many requests in flight.")
+    parser.add_argument("--use-threads", action="store_true",
+                        help="Use the threaded requests downloader even if httpx is installed.")
+    parser.add_argument("--compress", action="store_true",
+                        help="Save zstd-compressed price_history_yes_{market_id}.json.zst files (requires the zstandard package).")
+    parser.add_argument("--shard-size", type=int, default=None,
+                        help=f"Save price histories into {SHARD_PREFIX}{{k}}.jsonl files of this many markets each, indexed in {SHARD_INDEX_FILENAME}, instead of one file per market.")
 
     args = parser.parse_args()
+    if args.compress and zstandard is None:
+        parser.error("--compress requires the 'zstandard' package (pip install zstandard).")
+    if args.shard_size is not None and args.shard_size < 1:
+        parser.error("--shard-size must be at least 1.")
+    if args.shard_size is not None and args.compress:
+        parser.error("--compress and --shard-size cannot be combined (shard records are read by byte offset).")
 
     setup_logging(args.log_file)
     logging.info("--- Starting Price History Downloader Script ---")
     logging.info(f"Arguments: {vars(args)}")
 
-    output_path = Path(args.output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+    configure_session(SESSION, args.workers * 2)
+
+    os.makedirs(args.output_dir, exist_ok=True)
 
     # --- Phase 1: Extract all market and token ID pairs ---
-    market_token_pairs = extract_market_and_token_ids(args.market_details_dir)
+    market_token_pairs = extract_market_and_token_ids(args.market_details_dir, args.log_file)
 
     if not market_token_pairs:
         logging.warning("No valid (market_id, token_id) pairs extracted. Exiting.")
@@ -237,11 +629,11 @@ if __name__ == "__main__":
     logging.info(f"Found {len(market_token_pairs)} markets with valid first CLOB token IDs.")
 
     # --- Phase 2: Filter IDs that need fetching ---
+    done_ids = list_downloaded_market_ids(args.output_dir)
     pairs_to_fetch = []
     skipped_count = 0
     for market_id, clob_token_id in market_token_pairs:
-        history_file_path = output_path / f"price_history_yes_{market_id}.json"
-        if history_file_path.exists() and history_file_path.stat().st_size > 0:
+        if market_id in done_ids:
             skipped_count += 1
         else:
             pairs_to_fetch.append((market_id, clob_token_id))
@@ -255,44 +647,44 @@ if __name__ == "__main__":
         exit()
 
     # --- Phase 3: Fetch and Save details in parallel ---
-    success_count = 0
-    fetch_error_count = 0
-    save_error_count = 0
-    fetch_error_ids = []
-    save_error_ids = []
-
-    logging.info(f"Starting parallel fetching with {args.workers} workers...")
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
-        # Map future to the market_id for easier tracking
-        future_to_market_id = {
-            executor.submit(fetch_and_save_price_history, market_id, token_id, args.output_dir): market_id
-            for market_id, token_id in pairs_to_fetch
-        }
-
-        processed_futures = 0
-        for future in concurrent.futures.as_completed(future_to_market_id):
-            market_id = future_to_market_id[future]
-            processed_futures += 1
-            progress_percent = (processed_futures / needed_count) * 100 if needed_count > 0 else 0
+    outcomes = {"success": [], "fetch_error_or_no_data": [], "save_error": []}
+    on_result = functools.partial(record_result, outcomes, needed_count)
+    shard_writer = ShardWriter(args.output_dir, args.shard_size) if args.shard_size else None
+
+    if httpx is not None and not args.use_threads:
+        concurrency = args.workers * ASYNC_CONCURRENCY_PER_WORKER
+        logging.info(f"Starting async fetching with up to {concurrency} concurrent requests (HTTP/2: {HTTP2_AVAILABLE})...")
+        asyncio.run(download_price_histories_async(pairs_to_fetch, args.output_dir, concurrency, on_result, args.compress, shard_writer))
+    else:
+        logging.info(f"Starting parallel fetching with {args.workers} workers...")
 
-            try:
-                _id, status = future.result() # We know _id == market_id
-                if status == "success":
-                    success_count += 1
-                    logging.info(f"Progress: {processed_futures}/{needed_count} ({progress_percent:.1f}%) - Success   - Market ID: {market_id}")
-                elif status == "fetch_error_or_no_data":
-                    fetch_error_count += 1
-                    fetch_error_ids.append(market_id)
-                    logging.warning(f"Progress: {processed_futures}/{needed_count} ({progress_percent:.1f}%) - Fetch Err - Market ID: {market_id}")
-                elif status == "save_error":
-                    save_error_count += 1
-                    save_error_ids.append(market_id)
-                    logging.error(f"Progress: {processed_futures}/{needed_count} ({progress_percent:.1f}%) - Save Err  - Market ID: {market_id}")
-            except Exception as exc:
-                fetch_error_count += 1 # Count as fetch error if worker crashes
-                fetch_error_ids.append(market_id)
-                logging.error(f"Market ID {market_id} generated an exception in worker: {exc}", exc_info=True) # Log traceback
+        with queued_logging(), concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            # Map future to the market_id for easier tracking
+            future_to_market_id = {
+                executor.submit(fetch_and_save_price_history, market_id, token_id, args.output_dir, args.compress, shard_writer): market_id
+                for market_id, token_id in pairs_to_fetch
+            }
+
+            for future in concurrent.futures.as_completed(future_to_market_id):
+                market_id = future_to_market_id[future]
+                try:
+                    _id, status = future.result() # We know _id == market_id
+                except Exception as exc:
+                    logging.error(f"Market ID {market_id} generated an exception in worker: {exc}", exc_info=True) # Log traceback
+                    status = "fetch_error_or_no_data" # Count as fetch error if worker crashes
+                on_result(market_id, status)
+
+    if shard_writer is not None:
+        try:
+            shard_writer.close()
+        except OSError as e:
+            logging.error(f"Could not finish the last shard (its markets will be downloaded again on the next run): {e}")
+
+    success_count = len(outcomes["success"])
+    fetch_error_ids = outcomes["fetch_error_or_no_data"]
+    save_error_ids = outcomes["save_error"]
+    fetch_error_count = len(fetch_error_ids)
+    save_error_count = len(save_error_ids)
 
     logging.info("--- Price History Downloader Script Finished ---")
     logging.info(f"Total valid market/token pairs found: {total_pairs}")
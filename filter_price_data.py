@@ -1,6 +1,11 @@
 import json
 import os
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
 def load_analysis_results(file_path="analysis_results.json"):
     """Loads the analysis results from a JSON file."""
     if not os.path.exists(file_path):
@@ -8,8 +13,8 @@ def load_analysis_results(file_path="analysis_results.json"):
         print("Please run the analyze_price_data.py script first.")
         return None
     try:
-        with open(file_path, 'r') as f:
-            analysis_data = json.load(f)
+        with open(file_path, 'rb') as f:
+            analysis_data = orjson.loads(f.read()) if orjson else json.load(f)
         return analysis_data
     except json.JSONDecodeError:
         print(f"Error: Could not decode JSON from {file_path}.")
@@ -34,69 +39,90 @@ def apply_filters(analysis_data, criteria):
     if not analysis_data:
         return filtered_filenames
 
+    # Only the checks of the criteria that are set run for each record
+    checks = _compile_filter(criteria)
     for file_summary in analysis_data:
-        passes_filter = True
-
-        # Check min_num_points
-        if criteria.get("min_num_points") is not None and file_summary.get("num_points", 0) < criteria["min_num_points"]:
-            passes_filter = False
-        
-        # Check max_num_points
-        if criteria.get("max_num_points") is not None and file_summary.get("num_points", 0) > criteria["max_num_points"]:
-            passes_filter = False
-
-        # Check min_mean_price
-        if criteria.get("min_mean_price") is not None:
-            if file_summary.get("mean_price") is None or file_summary["mean_price"] < criteria["min_mean_price"]:
-                passes_filter = False
-        
-        # Check max_mean_price
-        if criteria.get("max_mean_price") is not None:
-            if file_summary.get("mean_price") is None or file_summary["mean_price"] > criteria["max_mean_price"]:
-                passes_filter = False
-
-        # Check min_std_dev_price
-        if criteria.get("min_std_dev_price") is not None:
-            if file_summary.get("std_dev_price") is None or file_summary["std_dev_price"] < criteria["min_std_dev_price"]:
-                passes_filter = False
-        
-        # Check max_std_dev_price
-        if criteria.get("max_std_dev_price") is not None:
-            if file_summary.get("std_dev_price") is None or file_summary["std_dev_price"] > criteria["max_std_dev_price"]:
-                passes_filter = False
-        
-        # Check exclude_issues
-        exclude_issues_list = criteria.get("exclude_issues", [])
-        if exclude_issues_list:
-            file_issues = file_summary.get("issues", [])
-            for issue_to_exclude in exclude_issues_list:
-                if issue_to_exclude in '; '.join(file_issues): # Check if the issue string is present
-                    passes_filter = False
-                    break
-        
-        # Check require_issues
-        require_issues_list = criteria.get("require_issues", [])
-        if require_issues_list:
-            file_issues_str = '; '.join(file_summary.get("issues", []))
-            for issue_to_require in require_issues_list:
-                if issue_to_require not in file_issues_str:
-                    passes_filter = False
-                    break
-        
-        # Check max_irregular_delta_seconds
-        # This checks if the largest gap between points exceeds the threshold
-        max_delta_filter = criteria.get("max_irregular_delta_seconds")
-        if max_delta_filter is not None:
-            time_delta_stats = file_summary.get("time_delta_stats", {})
-            max_recorded_delta = time_delta_stats.get("max_delta_seconds")
-            if max_recorded_delta is None or max_recorded_delta > max_delta_filter:
-                passes_filter = False
-
-        if passes_filter:
+        for check in checks:
+            if not check(file_summary):
+                break
+        else:
             filtered_filenames.append(file_summary["filename"])
-            
+
     return filtered_filenames
 
+def _compile_filter(criteria):
+    """
+    Returns the list of checks for the criteria that are actually set.
+
+    Each check takes one analysis result dict and returns True if it passes,
+    so unused criteria cost nothing per record.
+    """
+    checks = []
+
+    min_num_points = criteria.get("min_num_points")
+    if min_num_points is not None:
+        checks.append(lambda file_summary: file_summary.get("num_points", 0) >= min_num_points)
+    max_num_points = criteria.get("max_num_points")
+    if max_num_points is not None:
+        checks.append(lambda file_summary: file_summary.get("num_points", 0) <= max_num_points)
+
+    min_mean_price = criteria.get("min_mean_price")
+    if min_mean_price is not None:
+        checks.append(lambda file_summary: file_summary.get("mean_price") is not None
+                      and file_summary["mean_price"] >= min_mean_price)
+    max_mean_price = criteria.get("max_mean_price")
+    if max_mean_price is not None:
+        checks.append(lambda file_summary: file_summary.get("mean_price") is not None
+                      and file_summary["mean_price"] <= max_mean_price)
+
+    min_std_dev_price = criteria.get("min_std_dev_price")
+    if min_std_dev_price is not None:
+        checks.append(lambda file_summary: file_summary.get("std_dev_price") is not None
+                      and file_summary["std_dev_price"] >= min_std_dev_price)
+    max_std_dev_price = criteria.get("max_std_dev_price")
+    if max_std_dev_price is not None:
+        checks.append(lambda file_summary: file_summary.get("std_dev_price") is not None
+                      and file_summary["std_dev_price"] <= max_std_dev_price)
+
+    # This checks if the largest gap between points exceeds the threshold
+    max_delta_filter = criteria.get("max_irregular_delta_seconds")
+    if max_delta_filter is not None:
+        def check_max_delta(file_summary):
+            max_recorded_delta = file_summary.get("time_delta_stats", {}).get("max_delta_seconds")
+            return max_recorded_delta is not None and max_recorded_delta <= max_delta_filter
+        checks.append(check_max_delta)
+
+    # Issue checks look for each string anywhere in the '; '-joined issue list. Most
+    # records have no issues or just one, which are answered without building a string.
+    exclude_issues = tuple(criteria.get("exclude_issues") or ())
+    if exclude_issues:
+        exclude_clean_passes = "" not in exclude_issues # Only an empty string matches a record without issues
+        def check_exclude_issues(file_summary):
+            file_issues = file_summary.get("issues")
+            if not file_issues:
+                return exclude_clean_passes
+            file_issues_str = file_issues[0] if len(file_issues) == 1 else '; '.join(file_issues)
+            for issue_to_exclude in exclude_issues:
+                if issue_to_exclude in file_issues_str:
+                    return False
+            return True
+        checks.append(check_exclude_issues)
+    require_issues = tuple(criteria.get("require_issues") or ())
+    if require_issues:
+        require_clean_passes = all(issue_to_require == "" for issue_to_require in require_issues)
+        def check_require_issues(file_summary):
+            file_issues = file_summary.get("issues")
+            if not file_issues:
+                return require_clean_passes
+            file_issues_str = file_issues[0] if len(file_issues) == 1 else '; '.join(file_issues)
+            for issue_to_require in require_issues:
+                if issue_to_require not in file_issues_str:
+                    return False
+            return True
+        checks.append(check_require_issues)
+
+    return checks
+
 def main():
     analysis_file_path = "analysis_results.json"
     filtered_list_output_path = "filtered_filenames.txt"
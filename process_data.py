@@ -12,21 +12,70 @@ Task 3: Reads downloaded price history JSON files (price_history_yes_{id}.json)
 """
 
 import json
-import csv
 import logging
+import logging.handlers
 import argparse
 import os
+import collections
+import functools
+import contextlib
+import zipfile
+import gzip
+import io
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # Optional lazy parser for large event files (see load_event_json)
+    simdjson = None
+
+try:
+    import zstandard
+except ImportError:  # Only needed to read zstd-compressed (.json.zst) price history files
+    zstandard = None
+
+try:
+    import ijson
+except ImportError:  # Optional incremental parser for large price history files in Task 3
+    ijson = None
+
 # --- Constants ---
 # Prefixes to avoid column name collisions in TSV
 MARKET_PREFIX = "market_"
 EVENT_PREFIX = "event_"
 TIMESERIES_PREFIX = "timeseries_"
+ZSTD_SUFFIX = ".zst" # download_price_history.py --compress writes price_history_yes_{id}.json.zst
+SHARD_INDEX_FILENAME = "price_history_index.tsv" # download_price_history.py --shard-size: market_id, shard file, offset, length
+READ_BUFFER_SIZE = 1 << 20 # Read buffer for the market JSONL files (bytes)
+WRITE_BUFFER_SIZE = 4 << 20 # Write buffer for the market and event TSV files (bytes)
+GZIP_LEVEL = 6 # Compression level of the --gzip-tsv outputs (pigz's and gzip's default)
+LAZY_EVENT_PARSE_MIN_BYTES = 16 << 10 # Event files from this size on are parsed lazily with simdjson (bytes)
+LOG_BUFFER_CAPACITY = 1024 # Log records written to the log file at once with --quiet
+MARKET_ARCHIVE_SUFFIX = ".zip" # Task 1 with --market-archive writes markets_offset_{n}.zip (one per JSONL file)
+TASK1_WRITE_BATCH_SIZE = 256 # Market files per write task in Task 1, so each thread hand-off carries enough work
+PENDING_FILES_PER_PROCESS = 2 # Market files per --processes worker that Task 2 submits ahead of writing their rows
+TIMESERIES_CHUNKSIZE = 64 # Price histories per task handed to a --processes worker in Task 3
+STREAM_HISTORY_MIN_BYTES = 8 << 20 # Task 3 streams plain .json price histories from this size on with ijson (bytes)
+TIMESERIES_WRITE_BATCH_LINES = 65536 # Lines per write while streaming a price history in Task 3
+# Plain .json price histories shorter than this can only hold an empty history ('{"history":[]}' and its
+# indented forms), so Task 2 doesn't read them (bytes)
+PRICE_HISTORY_EMPTY_MAX_BYTES = 24
 
 # --- Helper Functions ---
-def setup_logging(log_file_path):
-    """Configures logging to both console and file."""
+def setup_logging(log_file_path, quiet=False, buffer_capacity=0):
+    """
+    Configures logging to both console and file, or to the file only if quiet.
+    With buffer_capacity > 0 file records are written in batches of that many
+    (errors and anything pending at exit are written right away).
+    """
     log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
@@ -38,25 +87,364 @@ def setup_logging(log_file_path):
     # File Handler
     file_handler = logging.FileHandler(log_file_path)
     file_handler.setFormatter(log_formatter)
-    root_logger.addHandler(file_handler)
+    if buffer_capacity > 0:
+        root_logger.addHandler(logging.handlers.MemoryHandler(buffer_capacity, target=file_handler))
+    else:
+        root_logger.addHandler(file_handler)
 
     # Console Handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_formatter)
-    root_logger.addHandler(console_handler)
+    if not quiet:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(log_formatter)
+        root_logger.addHandler(console_handler)
+
+class ShardedPriceHistory:
+    """One market's price history stored as a line of a price_history_shard_{k}.jsonl file."""
+    __slots__ = ('shard_path', 'offset', 'length', 'name')
+
+    def __init__(self, shard_path, offset, length):
+        self.shard_path = shard_path
+        self.offset = offset
+        self.length = length
+        self.name = f"{shard_path.name}@{offset}" # Used in log messages like a file name
+
+def load_sharded_price_histories(price_history_path):
+    """
+    Returns {market_id: ShardedPriceHistory} from the shard index of a
+    download_price_history.py --shard-size download, or {} if there is none.
+    """
+    sharded_histories = {}
+    try:
+        with open(price_history_path / SHARD_INDEX_FILENAME, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                if line.strip():
+                    market_id, shard_name, offset, length = line.rstrip('\n').split('\t')
+                    sharded_histories[market_id] = ShardedPriceHistory(price_history_path / shard_name, int(offset), int(length))
+    except FileNotFoundError:
+        pass # Not a sharded download
+    if sharded_histories:
+        logging.info(f"Found {len(sharded_histories)} sharded price histories in {SHARD_INDEX_FILENAME}.")
+    return sharded_histories
+
+def list_price_history_sizes(price_history_path):
+    """
+    Returns {file name: size in bytes} of the price history files in price_history_path
+    (one directory listing). Sizes are only looked up for plain .json files, which
+    is what has_price_history_entries uses them for; .json.zst files map to None.
+    """
+    price_history_sizes = {}
+    with os.scandir(price_history_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('price_history_yes_'):
+                price_history_sizes[entry.name] = entry.stat().st_size if entry.name.endswith('.json') else None
+    return price_history_sizes
+
+def find_price_history(price_history_path, market_id, sharded_histories, price_history_sizes):
+    """
+    Returns the price history file (.json, then .json.zst) or shard record of market_id, or None.
+    price_history_sizes is the dict from list_price_history_sizes, so no file is stat'ed.
+    """
+    file_name = f"price_history_yes_{market_id}.json"
+    if file_name in price_history_sizes:
+        return price_history_path / file_name
+    if file_name + ZSTD_SUFFIX in price_history_sizes:
+        return price_history_path / (file_name + ZSTD_SUFFIX)
+    return sharded_histories.get(market_id)
+
+def has_price_history_entries(file_path, file_size=None):
+    """
+    Returns whether a price history file or shard record has a non-empty 'history' list.
+    A plain .json file whose file_size is known and below PRICE_HISTORY_EMPTY_MAX_BYTES
+    can only hold an empty history and is not read; anything else is loaded and checked,
+    so corrupt files still raise (as in load_price_history).
+    """
+    if file_size is not None and file_size < PRICE_HISTORY_EMPTY_MAX_BYTES:
+        return False
+    price_data = load_price_history(file_path)
+    return isinstance(price_data.get('history'), list) and len(price_data['history']) > 0
+
+def load_price_history(file_path):
+    """
+    Loads a price history JSON file, decompressing it first if it is
+    zstd-compressed (.json.zst), or a ShardedPriceHistory record.
+    """
+    if isinstance(file_path, ShardedPriceHistory):
+        with open(file_path.shard_path, 'rb') as f:
+            f.seek(file_path.offset)
+            raw = f.read(file_path.length)
+        return (orjson.loads(raw) if orjson else json.loads(raw))['data']
+    if file_path.suffix == ZSTD_SUFFIX:
+        if zstandard is None:
+            raise IOError("the 'zstandard' package is required to read .zst files")
+        with open(file_path, 'rb') as f:
+            raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+    else:
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+_SIMDJSON_PARSER = simdjson.Parser() if simdjson else None
+
+def load_event_json(raw, event_key_set):
+    """
+    Parses the bytes of an event_{id}.json file.
+
+    Large files (mostly their nested 'markets' list) are parsed with simdjson when
+    available, and only the top-level keys in event_key_set are converted to Python
+    objects; the result then holds just those keys. Anything simdjson rejects (e.g.
+    integers over 64 bits) goes through the regular parser, which raises
+    json.JSONDecodeError for invalid JSON.
+    """
+    if _SIMDJSON_PARSER and len(raw) >= LAZY_EVENT_PARSE_MIN_BYTES:
+        try:
+            event_doc = _SIMDJSON_PARSER.parse(raw)
+        except (ValueError, RuntimeError):
+            event_doc = None
+        if isinstance(event_doc, simdjson.Object):
+            event_data = {}
+            for key in event_doc.keys():
+                if key in event_key_set:
+                    value = event_doc[key]
+                    if isinstance(value, simdjson.Object):
+                        value = value.as_dict()
+                    elif isinstance(value, simdjson.Array):
+                        value = value.as_list()
+                    event_data[key] = value
+            if event_data: # Events without any of the keys go through the regular parser below
+                return event_data
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def bounded_map(executor, fn, iterable, max_pending):
+    """
+    Like executor.map(fn, iterable), but submits at most max_pending tasks ahead of
+    the result being consumed, so results that finish faster than they are consumed
+    don't pile up in memory.
+    """
+    pending = collections.deque() # Futures in submission order
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
 
-def sanitize_value(value):
-    """Converts value to string and replaces TSV-breaking characters."""
+@contextlib.contextmanager
+def open_tsv_output(path, compress=False):
+    """
+    Opens a TSV output file for writing text, through a WRITE_BUFFER_SIZE buffer.
+
+    With compress the text is written gzip-compressed: piped to a pigz subprocess
+    when pigz is on the PATH, so compression runs on all cores alongside the work
+    in this process, else compressed in this process with the gzip module.
+    A pigz failure raises IOError when the file is closed.
+    """
+    if not compress:
+        with open(path, 'w', newline='', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as tsv_file:
+            yield tsv_file
+        return
+    pigz_path = shutil.which('pigz')
+    if pigz_path is None:
+        with gzip.open(path, 'wb', compresslevel=GZIP_LEVEL) as gzip_file, \
+             io.TextIOWrapper(io.BufferedWriter(gzip_file, WRITE_BUFFER_SIZE), encoding='utf-8', newline='') as tsv_file:
+            yield tsv_file
+        return
+    with open(path, 'wb') as out_file:
+        pigz = subprocess.Popen([pigz_path, '-c', f'-{GZIP_LEVEL}', '-p', str(os.cpu_count() or 1)],
+                                stdin=subprocess.PIPE, stdout=out_file, bufsize=WRITE_BUFFER_SIZE)
+        try:
+            with io.TextIOWrapper(pigz.stdin, encoding='utf-8', newline='') as tsv_file:
+                yield tsv_file
+        finally:
+            returncode = pigz.wait()
+        if returncode != 0:
+            raise IOError(f"pigz exited with status {returncode} while writing {path}")
+
+def read_file_bytes(file_path):
+    """Returns the contents of file_path (read on a thread by Task 2's event prefetching)."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def list_market_files(market_data_dir):
+    """Returns the markets_offset_*.jsonl files in market_data_dir, listed with a single os.scandir pass."""
+    with os.scandir(market_data_dir) as it:
+        return [Path(entry.path) for entry in it
+                if entry.name.startswith('markets_offset_') and entry.name.endswith('.jsonl') and entry.is_file()]
+
+def dump_market_json(market_data, pretty=False):
+    """Serializes a market to UTF-8 JSON bytes; compact unless pretty is set."""
+    if orjson:
+        return orjson.dumps(market_data, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(market_data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(market_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def sanitize_value(value, float_format=None):
+    """
+    Converts value to string and replaces TSV-breaking characters.
+    Floats are written with float_format (e.g. '.6g') if given, else exactly.
+    """
+    value_type = type(value)
+    if value_type is str: # Most values; skips the str() call
+        return value.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
     if value is None:
         return '' # Represent None as empty string in TSV
+    if value_type is float and float_format:
+        return format(value, float_format)
+    if value_type is int or value_type is float or value_type is bool:
+        return str(value) # Numbers and booleans never contain tabs or newlines
     s_value = str(value) # Ensure it's a string
     # Replace tabs, newlines, carriage returns with spaces
     s_value = s_value.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
     return s_value
 
+def _quote_tsv_field(value):
+    return '"' + value.replace('"', '""') + '"'
+
+def tsv_line(values):
+    """
+    Joins string values into one tab-separated line, quoting exactly the fields
+    csv.writer would (QUOTE_MINIMAL: those holding a quote, tab or newline).
+    """
+    return '\t'.join([_quote_tsv_field(value) if '"' in value or '\t' in value or '\n' in value else value
+                      for value in values]) + '\n'
+
+def timeseries_line(timestamp, price):
+    """
+    Returns the Task 3 TSV line of one price history point. Ints and floats (nearly
+    every point) can't hold characters to sanitize or quote, so they are formatted
+    directly, as str() would; anything else goes through sanitize_value and tsv_line.
+    """
+    timestamp_type = type(timestamp)
+    price_type = type(price)
+    if (timestamp_type is int or timestamp_type is float) and (price_type is int or price_type is float):
+        return f"{timestamp}\t{price}\n"
+    return tsv_line([sanitize_value(timestamp), sanitize_value(price)])
+
 # --- Task 1: Save Individual Market JSONs ---
-def save_individual_markets(market_data_dir, market_output_dir):
-    """Reads market JSONL files and saves each market into its own JSON file."""
+def _write_market_files(batch, market_archive=None):
+    """
+    Writes a batch of (output_filename, payload) market files, or stores them as
+    entries named output_filename.name in market_archive (an open zipfile.ZipFile).
+    Returns (written_count, [(output_filename, error), ...]).
+    """
+    written_count = 0
+    failures = []
+    for output_filename, payload in batch:
+        try:
+            if market_archive is not None:
+                market_archive.writestr(output_filename.name, payload)
+            else:
+                # A raw file descriptor skips creating a buffered file object per market
+                fd = os.open(output_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    view = memoryview(payload)
+                    while view:
+                        view = view[os.write(fd, view):]
+                finally:
+                    os.close(fd)
+            written_count += 1
+        except IOError as e:
+            failures.append((output_filename, e))
+    return written_count, failures
+
+def _serialize_market_file(file_path, market_output_path, write_batch, pretty=False):
+    """
+    Parses one market JSONL file and hands its serialized markets to
+    write_batch in batches of TASK1_WRITE_BATCH_SIZE (output_filename, payload)
+    pairs. Returns the number of lines/files that could not be processed.
+    """
+    error_count = 0
+    batch = []
+    logging.debug("Processing file for Task 1: %s", file_path.name)
+    try:
+        with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            for line_num, line in enumerate(f, 1):
+                try:
+                    market_data = orjson.loads(line) if orjson else json.loads(line)
+                    market_id = market_data.get('id')
+
+                    if not market_id:
+                        logging.warning(f"Skipping line {line_num} in {file_path.name}: Missing market ID.")
+                        error_count += 1
+                        continue
+
+                    output_filename = market_output_path / f"market_{market_id}.json"
+                    # Save the whole market object
+                    batch.append((output_filename, dump_market_json(market_data, pretty)))
+                    if len(batch) >= TASK1_WRITE_BATCH_SIZE:
+                        write_batch(batch)
+                        batch = []
+
+                except json.JSONDecodeError as e:
+                    logging.error(f"JSON decode error in {file_path.name}, line {line_num} (Task 1): {e}")
+                    error_count += 1
+                except Exception as e:
+                    logging.error(f"Unexpected error on line {line_num} in {file_path.name} (Task 1): {e}")
+                    error_count += 1
+
+    except IOError as e:
+        logging.error(f"Could not read file {file_path.name} (Task 1): {e}")
+        error_count += 1
+    except Exception as e:
+        logging.error(f"Unexpected error processing file {file_path.name} (Task 1): {e}")
+        error_count += 1
+
+    if batch:
+        write_batch(batch)
+    return error_count
+
+def open_market_archive(market_output_path, file_path):
+    """
+    Creates the uncompressed zip archive that holds the market_{id}.json files of
+    the market JSONL file file_path (markets_offset_{n}.zip in market_output_path).
+    """
+    return zipfile.ZipFile(market_output_path / (file_path.stem + MARKET_ARCHIVE_SUFFIX), 'w', zipfile.ZIP_STORED)
+
+def _save_market_file(file_path, market_output_path, pretty=False, archive=False):
+    """
+    Task 1 for one market JSONL file, writing inline (runs in a --processes worker),
+    into its own zip archive if archive is set (see open_market_archive).
+    Returns (written_count, [(output_filename, error), ...], error_count).
+    """
+    written_count = 0
+    failures = []
+    market_archive = None
+
+    def write_batch(batch):
+        nonlocal written_count
+        batch_written_count, batch_failures = _write_market_files(batch, market_archive)
+        written_count += batch_written_count
+        failures.extend(batch_failures)
+
+    if not archive:
+        error_count = _serialize_market_file(file_path, market_output_path, write_batch, pretty)
+        return written_count, failures, error_count
+    try:
+        with open_market_archive(market_output_path, file_path) as market_archive:
+            error_count = _serialize_market_file(file_path, market_output_path, write_batch, pretty)
+    except IOError as e:
+        logging.error(f"Could not write market archive for {file_path.name} (Task 1): {e}")
+        return 0, [], 1
+    return written_count, failures, error_count
+
+def save_individual_markets(market_data_dir, market_output_dir, write_workers=0, processes=0, log_file_path=None,
+                            pretty=False, quiet=False, archive=False):
+    """
+    Reads market JSONL files and saves each market into its own JSON file
+    (compact JSON, or indented with pretty).
+
+    With archive set, the market files of each JSONL file are instead stored
+    in one uncompressed zip archive (see open_market_archive), which keeps the
+    number of files in market_output_dir down to the number of JSONL files.
+    Each archive is written sequentially, so write_workers is not used then.
+
+    Markets are written in batches of TASK1_WRITE_BATCH_SIZE. With
+    write_workers > 0 the batches are written on a thread pool (at most
+    2 * write_workers queued), which hides per-file latency on slow
+    filesystems such as NFS; on a local disk writing inline is faster.
+    With processes > 0 the JSONL files are instead parsed, serialized and
+    written by a pool of that many processes, one file per task.
+    """
     logging.info("--- Starting Task 1: Saving Individual Market JSONs ---")
     market_data_path = Path(market_data_dir)
     market_output_path = Path(market_output_dir)
@@ -66,63 +454,246 @@ def save_individual_markets(market_data_dir, market_output_dir):
         logging.error(f"Market data directory not found: {market_data_dir}")
         return False
 
-    jsonl_files = list(market_data_path.glob('markets_offset_*.jsonl'))
+    jsonl_files = list_market_files(market_data_dir)
     logging.info(f"Found {len(jsonl_files)} market data files to process for Task 1.")
 
     processed_count = 0
     error_count = 0
 
-    for file_path in jsonl_files:
-        logging.debug(f"Processing file for Task 1: {file_path.name}")
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        market_data = json.loads(line.strip())
-                        market_id = market_data.get('id')
-
-                        if not market_id:
-                            logging.warning(f"Skipping line {line_num} in {file_path.name}: Missing market ID.")
-                            error_count += 1
-                            continue
-
-                        output_filename = market_output_path / f"market_{market_id}.json"
-                        # Save the whole market object
-                        with open(output_filename, 'w', encoding='utf-8') as out_f:
-                            json.dump(market_data, out_f, ensure_ascii=False, indent=4)
-                        processed_count += 1
-
-                    except json.JSONDecodeError as e:
-                        logging.error(f"JSON decode error in {file_path.name}, line {line_num} (Task 1): {e}")
-                        error_count += 1
-                    except IOError as e:
-                         logging.error(f"IO error writing {output_filename} (Task 1): {e}")
-                         error_count += 1
-                         # Optional: break if write error is critical
-                    except Exception as e:
-                        logging.error(f"Unexpected error on line {line_num} in {file_path.name} (Task 1): {e}")
-                        error_count += 1
-
-        except IOError as e:
-            logging.error(f"Could not read file {file_path.name} (Task 1): {e}")
-            error_count += 1
-        except Exception as e:
-            logging.error(f"Unexpected error processing file {file_path.name} (Task 1): {e}")
+    def count_written(result):
+        nonlocal processed_count, error_count
+        written_count, failures = result
+        processed_count += written_count
+        for output_filename, e in failures:
+            logging.error(f"IO error writing {output_filename} (Task 1): {e}")
             error_count += 1
 
+    if processes > 0:
+        with ProcessPoolExecutor(max_workers=processes, initializer=setup_logging,
+                                 initargs=(log_file_path, quiet)) as executor:
+            save_file = functools.partial(_save_market_file, market_output_path=market_output_path, pretty=pretty,
+                                          archive=archive)
+            for written_count, failures, file_error_count in executor.map(save_file, jsonl_files):
+                count_written((written_count, failures))
+                error_count += file_error_count
+    elif archive:
+        for file_path in jsonl_files:
+            written_count, failures, file_error_count = _save_market_file(file_path, market_output_path, pretty, archive)
+            count_written((written_count, failures))
+            error_count += file_error_count
+    else:
+        pending_batches = collections.deque() # Futures of batches being written, oldest first
+        executor = ThreadPoolExecutor(max_workers=write_workers) if write_workers > 0 else None
+
+        def write_batch(batch):
+            if executor is None:
+                count_written(_write_market_files(batch))
+            else:
+                if len(pending_batches) >= 2 * write_workers:
+                    count_written(pending_batches.popleft().result())
+                pending_batches.append(executor.submit(_write_market_files, batch))
+
+        for file_path in jsonl_files:
+            error_count += _serialize_market_file(file_path, market_output_path, write_batch, pretty)
+
+        if executor is not None:
+            while pending_batches:
+                count_written(pending_batches.popleft().result())
+            executor.shutdown()
+
     logging.info(f"--- Finished Task 1 --- ")
-    logging.info(f"Successfully saved {processed_count} individual market JSON files.")
+    logging.info(f"Successfully saved {processed_count} individual market JSON files{' (in zip archives)' if archive else ''}.")
     logging.info(f"Encountered {error_count} errors during Task 1.")
     return error_count == 0 # Return True if successful
 
 # --- Task 2: Create Market and Event TSV Files ---
-def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_history_dir, market_tsv_output, event_tsv_output):
+def _market_rows_from_file(file_path, price_history_path, sharded_histories, price_history_sizes, market_keys,
+                           market_output_path=None, pretty=False, float_format=None, market_archive=False):
+    """
+    Builds the market TSV rows of one market JSONL file (runs in a --processes worker).
+    Each row holds the market_keys values (floats formatted with float_format, see
+    sanitize_value) followed by the event IDs and price history columns, encoded as a
+    TSV line. With market_output_path set, each market is also saved to its own JSON
+    file there (Task 1) from the same parsed line, or to the file's zip archive with
+    market_archive (see open_market_archive).
+
+    Returns (market_rows, market_event_ids, market_count, parse_error_count,
+    price_history_check_errors, task1_result), where market_event_ids holds one
+    (market id for log messages, [event IDs]) pair per row and task1_result is
+    (written_count, [(output_filename, error), ...], error_count), or None
+    without market_output_path.
+    """
+    market_rows = []
+    market_event_ids = []
+    processed_market_count = 0
+    market_parse_error_count = 0
+    price_history_check_errors = 0
+    task1_written_count = 0
+    task1_failures = []
+    task1_error_count = 0
+    task1_batch = []
+    task1_archive = None
+    save_task1 = market_output_path is not None
+    if save_task1 and market_archive:
+        try:
+            task1_archive = open_market_archive(market_output_path, file_path)
+        except IOError as e:
+            logging.error(f"Could not create market archive for {file_path.name} (Task 1): {e}")
+            task1_error_count += 1
+            save_task1 = False
+
+    def write_task1_batch():
+        nonlocal task1_written_count
+        batch_written_count, batch_failures = _write_market_files(task1_batch, task1_archive)
+        task1_written_count += batch_written_count
+        task1_failures.extend(batch_failures)
+        task1_batch.clear()
+
+    logging.debug("Processing file for TSVs: %s", file_path.name)
+    try:
+        with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            for line_num, line in enumerate(f, 1):
+                processed_market_count += 1
+                market_data = None
+                current_event_ids = []
+                event_ids_str = ""
+
+                try:
+                    market_data = orjson.loads(line) if orjson else json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.error(f"Market JSON decode error in {file_path.name}, line {line_num}: {e}")
+                    market_parse_error_count += 1
+                    task1_error_count += 1
+                    continue # Skip this market line
+
+                if save_task1:
+                    if market_data and market_data.get('id'):
+                        output_filename = market_output_path / f"market_{market_data['id']}.json"
+                        task1_batch.append((output_filename, dump_market_json(market_data, pretty)))
+                        if len(task1_batch) >= TASK1_WRITE_BATCH_SIZE:
+                            write_task1_batch()
+                    else:
+                        logging.warning(f"Skipping line {line_num} in {file_path.name}: Missing market ID.")
+                        task1_error_count += 1
+
+                market_id = str(market_data.get('id', '')) if market_data else ''
+
+                # --- Process Market Row ---
+                market_events = market_data.get('events', []) if market_data else []
+                if isinstance(market_events, list):
+                    for event in market_events:
+                        if isinstance(event, dict) and 'id' in event:
+                            current_event_ids.append(str(event['id'])) # Ensure IDs are strings
+
+                # Create comma-separated string
+                event_ids_str = ",".join(current_event_ids)
+
+                # Check for non-empty price history file
+                has_non_empty_history = False
+                if market_id:
+                    price_hist_file = find_price_history(price_history_path, market_id, sharded_histories, price_history_sizes)
+                    if price_hist_file is not None:
+                        try:
+                            has_non_empty_history = has_price_history_entries(price_hist_file,
+                                                                              price_history_sizes.get(price_hist_file.name))
+                        except json.JSONDecodeError as e:
+                            logging.error(f"JSON decode error reading price history file {price_hist_file.name} for market {market_id}: {e}")
+                            price_history_check_errors += 1
+                        except IOError as e:
+                             logging.error(f"IOError reading price history file {price_hist_file.name} for market {market_id}: {e}")
+                             price_history_check_errors += 1
+                        except Exception as e:
+                            logging.error(f"Unexpected error checking price history file {price_hist_file.name} for market {market_id}: {e}")
+                            price_history_check_errors += 1
+                    # else: file doesn't exist, has_non_empty_history remains False
+
+                # Construct market row data (missing keys are written as empty strings)
+                if market_data:
+                    market_row_values = [sanitize_value(market_data.get(key, ''), float_format) for key in market_keys]
+                else:
+                    market_row_values = [''] * len(market_keys)
+                market_row_values.append(event_ids_str)
+                market_row_values.append(str(has_non_empty_history))
+
+                market_rows.append(tsv_line(market_row_values))
+                market_event_ids.append((market_data.get('id', '?') if market_data else '?', current_event_ids))
+
+    except IOError as e:
+        logging.error(f"Could not read market file {file_path.name}: {e}")
+        task1_error_count += 1
+    except Exception as e:
+         logging.error(f"Unexpected error processing market file {file_path.name} for TSVs: {e}")
+         task1_error_count += 1
+
+    if market_output_path is None:
+        task1_result = None
+    else:
+        if task1_batch:
+            write_task1_batch()
+        if task1_archive is not None:
+            try:
+                task1_archive.close()
+            except IOError as e:
+                logging.error(f"Could not write market archive for {file_path.name} (Task 1): {e}")
+                task1_error_count += 1
+        task1_result = (task1_written_count, task1_failures, task1_error_count)
+    return (market_rows, market_event_ids, processed_market_count, market_parse_error_count,
+            price_history_check_errors, task1_result)
+
+def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_history_dir, market_tsv_output, event_tsv_output,
+                                 processes=0, log_file_path=None, quiet=False, float_digits=0, gzip_tsv=False,
+                                 event_read_workers=0):
     """
     Reads market JSONL, event JSON, and checks price history data.
     Writes market data to market_tsv_output (one row per market, with comma-separated
     event IDs and price history indicator).
     Writes unique event data to event_tsv_output (one row per unique event).
+
+    With processes > 0 the market rows of each JSONL file are built on a pool
+    of that many processes; rows are still written in file order.
+    With float_digits > 0 float values are rounded to that many significant
+    digits (shorter and faster to format, but lossy); by default they are exact.
+    With gzip_tsv both TSV files are written gzip-compressed (see open_tsv_output).
+    With event_read_workers > 0 the event files referenced by each market file are
+    read on that many threads while the next market file is parsed, which hides
+    per-file latency on slow filesystems such as NFS; their rows are written one
+    market file later, in the same order.
+    """
+    task1_success, task2_success = _create_market_and_event_tsvs(market_data_dir, event_details_dir, price_history_dir,
+                                                                 market_tsv_output, event_tsv_output, processes,
+                                                                 log_file_path, quiet, float_digits=float_digits,
+                                                                 gzip_tsv=gzip_tsv, event_read_workers=event_read_workers)
+    return task2_success
+
+def save_markets_and_create_tsvs(market_data_dir, market_output_dir, event_details_dir, price_history_dir,
+                                 market_tsv_output, event_tsv_output, processes=0, log_file_path=None, pretty=False,
+                                 quiet=False, float_digits=0, archive=False, gzip_tsv=False, event_read_workers=0):
+    """
+    Runs Task 1 and Task 2 in a single pass over the market JSONL files: each
+    line is read and parsed once, then both saved to its own JSON file (as in
+    save_individual_markets, written inline, into zip archives with archive)
+    and turned into a TSV row (as in create_market_and_event_tsvs).
+
+    Returns (task1_success, task2_success).
+    """
+    return _create_market_and_event_tsvs(market_data_dir, event_details_dir, price_history_dir, market_tsv_output,
+                                         event_tsv_output, processes, log_file_path, quiet, market_output_dir, pretty,
+                                         float_digits, archive, gzip_tsv, event_read_workers)
+
+def _create_market_and_event_tsvs(market_data_dir, event_details_dir, price_history_dir, market_tsv_output,
+                                  event_tsv_output, processes, log_file_path, quiet, market_output_dir=None, pretty=False,
+                                  float_digits=0, archive=False, gzip_tsv=False, event_read_workers=0):
+    """
+    Task 2, plus Task 1 from the same parsed lines when market_output_dir is set.
+    Returns (task1_success, task2_success); task1_success is None without market_output_dir.
     """
+    task1_if_failed = None if market_output_dir is None else False # Task 1 result when Task 2 stops early
+    if market_output_dir is not None:
+        logging.info("--- Starting Task 1: Saving Individual Market JSONs (in the Task 2 pass) ---")
+        market_output_path = Path(market_output_dir)
+        market_output_path.mkdir(parents=True, exist_ok=True)
+    else:
+        market_output_path = None
     logging.info("--- Starting Task 2: Creating Market and Event TSV Files ---")
     market_data_path = Path(market_data_dir)
     event_details_path = Path(event_details_dir)
@@ -132,13 +703,19 @@ def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_histo
 
     if not market_data_path.is_dir():
         logging.error(f"Market data directory not found: {market_data_dir}")
-        return False
+        return task1_if_failed, False
     if not event_details_path.is_dir():
         logging.error(f"Event details directory not found: {event_details_dir}")
-        return False
+        return task1_if_failed, False
     if not price_history_path.is_dir():
         logging.error(f"Price history directory not found: {price_history_dir}")
-        return False
+        return task1_if_failed, False
+    sharded_histories = load_sharded_price_histories(price_history_path)
+    price_history_sizes = list_price_history_sizes(price_history_path)
+    # One listing of the event directory answers every "is the event file there?" check,
+    # so missing events cost no failed open() calls
+    with os.scandir(event_details_path) as entries:
+        event_file_names = {entry.name for entry in entries}
 
     # --- Step 2.1: Define Headers ---
     # Keep prefixes for clarity, especially if analyzing raw files later
@@ -172,6 +749,13 @@ def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_histo
     ]
     event_headers_prefixed = [EVENT_PREFIX + h for h in event_headers]
 
+    # Keys looked up for each row, in column order. Neither list includes the nested
+    # structures (the market's 'events' list; the event's markets, series and tags).
+    market_keys = market_headers
+    event_keys = event_headers
+    event_key_set = set(event_keys)
+    float_format = f".{float_digits}g" if float_digits > 0 else None
+
     logging.info(f"Market TSV will contain {len(market_headers_with_ids)} columns.")
     logging.info(f"Event TSV will contain {len(event_headers_prefixed)} columns.")
 
@@ -184,141 +768,128 @@ def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_histo
     event_parse_error_count = 0
     processed_event_ids = set() # To track unique events written
     price_history_check_errors = 0
+    task1_processed_count = 0
+    task1_error_count = 0
 
-    jsonl_files = list(market_data_path.glob('markets_offset_*.jsonl'))
+    jsonl_files = list_market_files(market_data_dir)
     logging.info(f"Found {len(jsonl_files)} market data files to process for Task 2.")
 
     try:
-        # Open both files for writing
-        with open(market_tsv_path, 'w', newline='', encoding='utf-8') as market_tsvfile, \
-             open(event_tsv_path, 'w', newline='', encoding='utf-8') as event_tsvfile:
+        # Open both files for writing (gzip-compressed with gzip_tsv)
+        # Large buffers turn the many row writes into a few big write calls
+        with open_tsv_output(market_tsv_path, gzip_tsv) as market_tsvfile, \
+             open_tsv_output(event_tsv_path, gzip_tsv) as event_tsvfile:
 
-            market_writer = csv.writer(market_tsvfile, delimiter='\t', lineterminator='\n')
-            event_writer = csv.writer(event_tsvfile, delimiter='\t', lineterminator='\n')
+            # Write Headers (all rows are built by tsv_line, which quotes like csv.writer)
+            market_tsvfile.write(tsv_line(market_headers_with_ids))
+            event_tsvfile.write(tsv_line(event_headers_prefixed))
 
-            # Write Headers
-            market_writer.writerow(market_headers_with_ids)
-            event_writer.writerow(event_headers_prefixed)
+            # Process each market file (on worker processes with --processes). Market rows
+            # come back per file in order; events are deduplicated and loaded here. Only a
+            # few files per worker are in flight, so the rows of files the workers have
+            # finished but that aren't written yet stay bounded in memory.
+            market_rows_from_file = functools.partial(_market_rows_from_file, price_history_path=price_history_path,
+                                                      sharded_histories=sharded_histories,
+                                                      price_history_sizes=price_history_sizes,
+                                                      market_keys=market_keys, market_output_path=market_output_path,
+                                                      pretty=pretty, float_format=float_format,
+                                                      market_archive=archive)
+            def write_event_rows(events):
+                """Loads and writes the (event_id, market_log_id, event file path or read future) events."""
+                nonlocal written_event_rows, event_file_missing_count, event_parse_error_count
+                for event_id, market_log_id, event_source in events:
+                    event_data = None
+                    if event_source is None:
+                        logging.warning(f"Event file not found for event ID {event_id} (from market {market_log_id})")
+                        event_file_missing_count += 1
+                    else:
+                        try:
+                            raw = event_source.result() if read_executor is not None else read_file_bytes(event_source)
+                            event_data = load_event_json(raw, event_key_set)
+                            if not isinstance(event_data, dict):
+                                logging.error(f"Event JSON for event_{event_id}.json is not an object: {type(event_data).__name__}")
+                                event_data = None
+                                event_parse_error_count += 1
+                        except json.JSONDecodeError as e:
+                            logging.error(f"Event JSON decode error for event_{event_id}.json: {e}")
+                            event_parse_error_count += 1
+                        except IOError as e:
+                            logging.error(f"IOError reading event file event_{event_id}.json: {e}")
+                            event_parse_error_count += 1
 
-            # Process each market file
-            for file_path in jsonl_files:
-                logging.debug(f"Processing file for TSVs: {file_path.name}")
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        for line_num, line in enumerate(f, 1):
-                            processed_market_count += 1
-                            market_data = None
-                            current_event_ids = []
-                            event_ids_str = ""
-
-                            try:
-                                market_data = json.loads(line.strip())
-                            except json.JSONDecodeError as e:
-                                logging.error(f"Market JSON decode error in {file_path.name}, line {line_num}: {e}")
-                                market_parse_error_count += 1
-                                continue # Skip this market line
-
-                            market_id = str(market_data.get('id', '')) if market_data else ''
-
-                            # --- Process Market Row ---
-                            market_events = market_data.get('events', []) if market_data else []
-                            if isinstance(market_events, list):
-                                for event in market_events:
-                                    if isinstance(event, dict) and 'id' in event:
-                                        current_event_ids.append(str(event['id'])) # Ensure IDs are strings
-
-                            # Create comma-separated string
-                            event_ids_str = ",".join(current_event_ids)
-
-                            # Check for non-empty price history file
-                            has_non_empty_history = False
-                            if market_id:
-                                price_hist_file = price_history_path / f"price_history_yes_{market_id}.json"
-                                if price_hist_file.exists():
-                                    try:
-                                        with open(price_hist_file, 'r', encoding='utf-8') as phf:
-                                            price_data = json.load(phf)
-                                            if isinstance(price_data.get('history'), list) and len(price_data['history']) > 0:
-                                                has_non_empty_history = True
-                                    except json.JSONDecodeError as e:
-                                        logging.error(f"JSON decode error reading price history file {price_hist_file.name} for market {market_id}: {e}")
-                                        price_history_check_errors += 1
-                                    except IOError as e:
-                                         logging.error(f"IOError reading price history file {price_hist_file.name} for market {market_id}: {e}")
-                                         price_history_check_errors += 1
-                                    except Exception as e:
-                                        logging.error(f"Unexpected error checking price history file {price_hist_file.name} for market {market_id}: {e}")
-                                        price_history_check_errors += 1
-                                # else: file doesn't exist, has_non_empty_history remains False
-
-                            # Construct market row data
-                            market_row_values = []
-                            for header in market_headers_with_ids:
-                                value = '' # Default to empty string
-                                if header == MARKET_PREFIX + 'event_ids':
-                                    value = event_ids_str
-                                elif header == MARKET_PREFIX + 'downloaded_pricehistory_nonempty':
-                                     value = str(has_non_empty_history)
-                                elif header.startswith(MARKET_PREFIX):
-                                    key = header[len(MARKET_PREFIX):]
-                                    if market_data:
-                                        # Exclude the original 'events' list itself from being written
-                                        if key != 'events':
-                                            value = market_data.get(key, '')
-                                market_row_values.append(sanitize_value(value))
-
-                            # Write the market row
-                            market_writer.writerow(market_row_values)
-                            written_market_rows += 1
-
-                            # --- Process Event Rows (Unique) ---
-                            for event_id in current_event_ids:
-                                if event_id not in processed_event_ids:
-                                    event_file = event_details_path / f"event_{event_id}.json"
-                                    event_data = None
-                                    if event_file.is_file():
-                                        try:
-                                            with open(event_file, 'r', encoding='utf-8') as ef:
-                                                event_data = json.load(ef)
-                                        except json.JSONDecodeError as e:
-                                            logging.error(f"Event JSON decode error for {event_file.name}: {e}")
-                                            event_parse_error_count += 1
-                                        except IOError as e:
-                                            logging.error(f"IOError reading event file {event_file.name}: {e}")
-                                            event_parse_error_count += 1
-                                    else:
-                                        logging.warning(f"Event file not found for event ID {event_id} (from market {market_data.get('id', '?')})")
-                                        event_file_missing_count += 1
-
-                                    # If event data loaded successfully, write it
-                                    if event_data:
-                                        event_row_values = []
-                                        for header in event_headers_prefixed:
-                                            value = ''
-                                            if header.startswith(EVENT_PREFIX):
-                                                key = header[len(EVENT_PREFIX):]
-                                                # Exclude complex nested structures explicitly
-                                                if key not in ['markets', 'series', 'tags']:
-                                                     value = event_data.get(key, '')
-                                            event_row_values.append(sanitize_value(value))
-
-                                        event_writer.writerow(event_row_values)
-                                        written_event_rows += 1
-
-                                    # Mark this event ID as processed regardless of success/failure to prevent retries
-                                    processed_event_ids.add(event_id)
-
-                except IOError as e:
-                    logging.error(f"Could not read market file {file_path.name}: {e}")
-                except Exception as e:
-                     logging.error(f"Unexpected error processing market file {file_path.name} for TSVs: {e}")
+                    # If event data loaded successfully, write it
+                    if event_data:
+                        event_tsvfile.write(tsv_line([sanitize_value(event_data.get(key, ''), float_format) for key in event_keys]))
+                        written_event_rows += 1
+
+            with contextlib.ExitStack() as stack:
+                if processes > 0:
+                    executor = stack.enter_context(ProcessPoolExecutor(max_workers=processes, initializer=setup_logging,
+                                                                       initargs=(log_file_path, quiet)))
+                    file_results = bounded_map(executor, market_rows_from_file, jsonl_files,
+                                               PENDING_FILES_PER_PROCESS * processes)
+                else:
+                    file_results = map(market_rows_from_file, jsonl_files)
+                read_executor = None
+                if event_read_workers > 0:
+                    read_executor = stack.enter_context(ThreadPoolExecutor(max_workers=event_read_workers))
+                pending_events = [] # Events of the previous market file, being read by read_executor
+
+                for (market_rows, market_event_ids, file_market_count, file_parse_error_count, file_price_history_errors,
+                     task1_result) in file_results:
+                    processed_market_count += file_market_count
+                    market_parse_error_count += file_parse_error_count
+                    price_history_check_errors += file_price_history_errors
+                    if task1_result is not None:
+                        written_count, failures, file_task1_error_count = task1_result
+                        task1_processed_count += written_count
+                        for output_filename, e in failures:
+                            logging.error(f"IO error writing {output_filename} (Task 1): {e}")
+                        task1_error_count += len(failures) + file_task1_error_count
+
+                    # Write the market rows
+                    market_tsvfile.write(''.join(market_rows))
+                    written_market_rows += len(market_rows)
+
+                    # --- Process Event Rows (Unique) ---
+                    # New events in order of first reference, marked as processed right away
+                    # (regardless of success/failure) to prevent retries
+                    new_events = []
+                    for market_log_id, current_event_ids in market_event_ids:
+                        for event_id in current_event_ids:
+                            if event_id not in processed_event_ids:
+                                processed_event_ids.add(event_id)
+                                event_file_name = f"event_{event_id}.json"
+                                if event_file_name not in event_file_names:
+                                    new_events.append((event_id, market_log_id, None))
+                                elif read_executor is not None:
+                                    new_events.append((event_id, market_log_id, read_executor.submit(
+                                        read_file_bytes, os.path.join(event_details_dir, event_file_name))))
+                                else:
+                                    new_events.append((event_id, market_log_id, os.path.join(event_details_dir, event_file_name)))
+                    if read_executor is not None:
+                        # This file's event files are read in the background while the next market
+                        # file is parsed; the previous file's events, read by now, are written
+                        write_event_rows(pending_events)
+                        pending_events = new_events
+                    else:
+                        write_event_rows(new_events)
+
+                write_event_rows(pending_events)
 
     except IOError as e:
         logging.error(f"Could not open or write to TSV files ({market_tsv_path} / {event_tsv_path}): {e}")
-        return False
+        return task1_if_failed, False
     except Exception as e:
         logging.error(f"An unexpected error occurred during TSV creation: {e}")
-        return False
+        return task1_if_failed, False
+
+    task1_success = None
+    if market_output_path is not None:
+        logging.info(f"--- Finished Task 1 --- ")
+        logging.info(f"Successfully saved {task1_processed_count} individual market JSON files{' (in zip archives)' if archive else ''}.")
+        logging.info(f"Encountered {task1_error_count} errors during Task 1.")
+        task1_success = task1_error_count == 0
 
     logging.info("--- Finished Task 2 --- ")
     logging.info(f"Processed {processed_market_count} market records.")
@@ -329,12 +900,121 @@ def create_market_and_event_tsvs(market_data_dir, event_details_dir, price_histo
     logging.info(f"Event files missing (when referenced by market): {event_file_missing_count}")
     logging.info(f"Price history file check errors: {price_history_check_errors}")
     # Removed 'Markets with no valid first event' count as it's no longer relevant
-    return True
+    return task1_success, True
 
 # --- Task 3: Create Individual Timeseries TSVs ---
-def create_timeseries_tsvs(price_history_dir, timeseries_output_dir):
+def _stream_timeseries_tsv(history_file, file_path, output_filename):
+    """
+    Writes the timeseries TSV of a large price history JSON file, open in binary mode
+    as history_file, while parsing it with ijson, so the history is never held in
+    memory as a whole. The output file is only created once the first history item
+    is read. Returns "written" or "skipped" (no history items); a write error raises
+    IOError and invalid JSON raises ijson.JSONError, and any error removes the partial
+    output file. history_file must hold a JSON object (see _write_timeseries_tsv).
+    """
+    tsf = None
+    try:
+        lines = []
+        for item in ijson.items(history_file, 'history.item', use_float=True):
+            if tsf is None:
+                tsf = open(output_filename, 'w', newline='', encoding='utf-8')
+                lines.append(tsv_line(['timestamp', 'price'])) # Header
+            if isinstance(item, dict) and 't' in item and 'p' in item:
+                lines.append(timeseries_line(item['t'], item['p']))
+            else:
+                logging.warning(f"Skipping invalid history item in {file_path.name}: {item}")
+            if len(lines) >= TIMESERIES_WRITE_BATCH_LINES:
+                tsf.write(''.join(lines))
+                lines.clear()
+        if tsf is None:
+            return "skipped"
+        tsf.write(''.join(lines))
+    except Exception:
+        if tsf is not None:
+            tsf.close()
+            tsf = None
+            output_filename.unlink()
+        raise
+    finally:
+        if tsf is not None:
+            tsf.close()
+    return "written"
+
+def _write_timeseries_tsv(history_source, timeseries_output_path):
+    """
+    Task 3 for one (market_id, price history file or shard record) pair (runs in a
+    --processes worker). Returns "written", "skipped" (empty or invalid history) or "error".
+    Plain .json files of at least STREAM_HISTORY_MIN_BYTES are streamed with ijson when
+    it is installed (see _stream_timeseries_tsv); smaller ones are faster to load whole.
+    """
+    market_id, file_path = history_source
+    output_filename = timeseries_output_path / f"timeseries_{market_id}.tsv"
+
+    try:
+        if ijson and isinstance(file_path, Path) and file_path.suffix == '.json':
+            with open(file_path, 'rb') as history_file:
+                # Anything but a top-level object is left to the whole-file path below,
+                # so malformed files are reported the same way whatever their size
+                is_object = history_file.read(64).lstrip()[:1] == b'{'
+                history_file.seek(0)
+                if is_object and os.fstat(history_file.fileno()).st_size >= STREAM_HISTORY_MIN_BYTES:
+                    try:
+                        outcome = _stream_timeseries_tsv(history_file, file_path, output_filename)
+                    except ijson.JSONError as e:
+                        logging.error(f"JSON decode error in {file_path.name} (Task 3): {e}")
+                        return "error"
+                    except IOError as e:
+                        logging.error(f"IO error streaming {file_path.name} to {output_filename.name}: {e}")
+                        return "error"
+                    if outcome == "written":
+                        logging.debug("Successfully wrote timeseries TSV: %s", output_filename.name)
+                    else:
+                        logging.debug("Skipping empty or invalid history in %s", file_path.name)
+                    return outcome
+                raw = history_file.read()
+            price_data = orjson.loads(raw) if orjson else json.loads(raw)
+        else:
+            price_data = load_price_history(file_path)
+        if not isinstance(price_data, dict):
+            logging.error(f"Unexpected top-level JSON type in {file_path.name} (Task 3): {type(price_data).__name__}")
+            return "error"
+        history_list = price_data.get('history')
+
+        # Check if history is a non-empty list
+        if isinstance(history_list, list) and len(history_list) > 0:
+            try:
+                with open(output_filename, 'w', newline='', encoding='utf-8') as tsf:
+                    lines = [tsv_line(['timestamp', 'price'])] # Header
+                    for item in history_list:
+                        # Ensure item is a dict with 't' and 'p'
+                        if isinstance(item, dict) and 't' in item and 'p' in item:
+                            lines.append(timeseries_line(item['t'], item['p']))
+                        else:
+                            logging.warning(f"Skipping invalid history item in {file_path.name}: {item}")
+                    tsf.write(''.join(lines))
+                logging.debug("Successfully wrote timeseries TSV: %s", output_filename.name)
+                return "written"
+            except IOError as e:
+                 logging.error(f"IO error writing {output_filename.name}: {e}")
+                 return "error"
+        else:
+            logging.debug("Skipping empty or invalid history in %s", file_path.name)
+            return "skipped"
+
+    except json.JSONDecodeError as e:
+        logging.error(f"JSON decode error in {file_path.name} (Task 3): {e}")
+    except IOError as e:
+        logging.error(f"Could not read file {file_path.name} (Task 3): {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error processing file {file_path.name} (Task 3): {e}")
+    return "error"
+
+def create_timeseries_tsvs(price_history_dir, timeseries_output_dir, processes=0, log_file_path=None, quiet=False):
     """
     Reads price history JSON files and creates TSV for each non-empty history.
+
+    With processes > 0 the histories are converted on a pool of that many
+    processes, in chunks of TIMESERIES_CHUNKSIZE.
     """
     logging.info("--- Starting Task 3: Creating Individual Timeseries TSV Files ---")
     price_history_path = Path(price_history_dir)
@@ -345,54 +1025,39 @@ def create_timeseries_tsvs(price_history_dir, timeseries_output_dir):
         logging.error(f"Price history directory not found: {price_history_dir}")
         return False
 
-    history_files = list(price_history_path.glob('price_history_yes_*.json'))
+    # One os.scandir pass. Each market is converted once, from the same source find_price_history
+    # picks: its .json file, else its .json.zst file, else its shard record (--shard-size)
+    history_files = {}
+    zstd_history_files = {}
+    with os.scandir(price_history_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('price_history_yes_'):
+                if entry.name.endswith('.json'):
+                    history_files[entry.name[len('price_history_yes_'):-len('.json')]] = Path(entry.path)
+                elif entry.name.endswith('.json' + ZSTD_SUFFIX):
+                    zstd_history_files[entry.name[len('price_history_yes_'):-len('.json' + ZSTD_SUFFIX)]] = Path(entry.path)
+    for market_id, file_path in zstd_history_files.items():
+        history_files.setdefault(market_id, file_path)
     logging.info(f"Found {len(history_files)} price history files to process for Task 3.")
 
-    processed_count = 0
-    written_count = 0
-    skipped_empty_count = 0
-    error_count = 0
-
-    for file_path in history_files:
-        processed_count += 1
-        market_id = file_path.stem.replace('price_history_yes_', '')
-        output_filename = timeseries_output_path / f"timeseries_{market_id}.tsv"
-
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                price_data = json.load(f)
-                history_list = price_data.get('history')
+    history_sources = list(history_files.items())
+    history_sources += [(market_id, sharded_history)
+                        for market_id, sharded_history in load_sharded_price_histories(price_history_path).items()
+                        if market_id not in history_files]
 
-                # Check if history is a non-empty list
-                if isinstance(history_list, list) and len(history_list) > 0:
-                    try:
-                        with open(output_filename, 'w', newline='', encoding='utf-8') as tsf:
-                            writer = csv.writer(tsf, delimiter='\t', lineterminator='\n')
-                            writer.writerow(['timestamp', 'price']) # Write header
-                            for item in history_list:
-                                # Ensure item is a dict with 't' and 'p'
-                                if isinstance(item, dict) and 't' in item and 'p' in item:
-                                    writer.writerow([sanitize_value(item['t']), sanitize_value(item['p'])])
-                                else:
-                                    logging.warning(f"Skipping invalid history item in {file_path.name}: {item}")
-                        written_count += 1
-                        logging.debug(f"Successfully wrote timeseries TSV: {output_filename.name}")
-                    except IOError as e:
-                         logging.error(f"IO error writing {output_filename.name}: {e}")
-                         error_count += 1
-                else:
-                    logging.debug(f"Skipping empty or invalid history in {file_path.name}")
-                    skipped_empty_count += 1
+    write_timeseries_tsv = functools.partial(_write_timeseries_tsv, timeseries_output_path=timeseries_output_path)
+    if processes > 0:
+        with ProcessPoolExecutor(max_workers=processes, initializer=setup_logging,
+                                 initargs=(log_file_path, quiet)) as executor:
+            outcome_counts = collections.Counter(executor.map(write_timeseries_tsv, history_sources,
+                                                              chunksize=TIMESERIES_CHUNKSIZE))
+    else:
+        outcome_counts = collections.Counter(map(write_timeseries_tsv, history_sources))
 
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON decode error in {file_path.name} (Task 3): {e}")
-            error_count += 1
-        except IOError as e:
-            logging.error(f"Could not read file {file_path.name} (Task 3): {e}")
-            error_count += 1
-        except Exception as e:
-            logging.error(f"Unexpected error processing file {file_path.name} (Task 3): {e}")
-            error_count += 1
+    processed_count = len(history_sources)
+    written_count = outcome_counts["written"]
+    skipped_empty_count = outcome_counts["skipped"]
+    error_count = outcome_counts["error"]
 
     logging.info(f"--- Finished Task 3 --- ")
     logging.info(f"Processed {processed_count} price history files.")
@@ -420,6 +1085,22 @@ if __name__ == "__main__":
                         help="Directory to save individual timeseries TSV files (Task 3). Only required if not skipping Task 3.")
     parser.add_argument("--log-file", type=str, default="process_data.log",
                         help="Path to the log file.")
+    parser.add_argument("--write-workers", type=int, default=0,
+                        help="Threads writing the individual market JSON files in Task 1 (default: 0, write on the main thread). Helps on high-latency filesystems such as NFS.")
+    parser.add_argument("--event-read-workers", type=int, default=0,
+                        help="Threads reading the event detail files of Task 2 ahead, while the next market file is parsed (default: 0, read when needed). Helps on high-latency filesystems such as NFS.")
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent the individual market JSON files of Task 1 for human inspection (default: compact).")
+    parser.add_argument("--market-archive", action="store_true",
+                        help="Store the market JSON files of Task 1 in one uncompressed zip archive per market JSONL file (markets_offset_{n}.zip) instead of one file per market.")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Parse the market JSONL files of Tasks 1 and 2 (one file per task) and convert the price histories of Task 3 on this many processes (default: 0, in the main process).")
+    parser.add_argument("--tsv-float-digits", type=int, default=0,
+                        help="Round float values in the Task 2 TSVs to this many significant digits (default: 0, exact). Lossy, but shorter and faster to write.")
+    parser.add_argument("--gzip-tsv", action="store_true",
+                        help="Write the Task 2 TSVs gzip-compressed to the given paths (e.g. markets.tsv.gz), on all cores with pigz when it is installed.")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Log to the log file only (buffered), printing just the task results to stdout.")
     parser.add_argument("--skip-task1", action="store_true",
                         help="Skip Task 1 (Saving individual market JSONs).")
     parser.add_argument("--skip-task2", action="store_true",
@@ -443,45 +1124,85 @@ if __name__ == "__main__":
              parser.error("--price-history-dir is required when Task 3 is not skipped.")
         if not args.timeseries_output_dir:
              parser.error("--timeseries-output-dir is required when Task 3 is not skipped.")
+    if args.event_read_workers < 0:
+        parser.error("--event-read-workers must be 0 or a positive number of threads.")
+    if args.tsv_float_digits < 0:
+        parser.error("--tsv-float-digits must be 0 or a positive number of digits.")
 
 
-    setup_logging(args.log_file)
+    setup_logging(args.log_file, args.quiet, LOG_BUFFER_CAPACITY if args.quiet else 0)
     logging.info("--- Starting Data Processing Script ---")
     logging.info(f"Arguments: {vars(args)}")
 
     task1_success = True
-    if not args.skip_task1:
-        task1_success = save_individual_markets(args.market_data_dir, args.market_output_dir)
-    else:
-        logging.info("Skipping Task 1 based on arguments.")
-
     task2_success = True
-    # Only run task 2 if it's not skipped
-    if not args.skip_task2:
-        task2_success = create_market_and_event_tsvs(
+    # Tasks 1 and 2 share one pass over the JSONL files unless Task 1 writes on its own threads
+    # (archives are written sequentially, without --write-workers threads)
+    if not args.skip_task1 and not args.skip_task2 and (args.write_workers == 0 or args.market_archive):
+        task1_success, task2_success = save_markets_and_create_tsvs(
             args.market_data_dir,
+            args.market_output_dir,
             args.event_details_dir,
             args.price_history_dir,
             args.market_tsv_output,
-            args.event_tsv_output
+            args.event_tsv_output,
+            args.processes,
+            args.log_file,
+            args.pretty,
+            args.quiet,
+            args.tsv_float_digits,
+            args.market_archive,
+            args.gzip_tsv,
+            args.event_read_workers
         )
     else:
-         logging.info("Skipping Task 2 based on arguments.")
+        if not args.skip_task1:
+            task1_success = save_individual_markets(args.market_data_dir, args.market_output_dir, args.write_workers,
+                                                    args.processes, args.log_file, args.pretty, args.quiet,
+                                                    args.market_archive)
+        else:
+            logging.info("Skipping Task 1 based on arguments.")
+
+        # Only run task 2 if it's not skipped
+        if not args.skip_task2:
+            task2_success = create_market_and_event_tsvs(
+                args.market_data_dir,
+                args.event_details_dir,
+                args.price_history_dir,
+                args.market_tsv_output,
+                args.event_tsv_output,
+                args.processes,
+                args.log_file,
+                args.quiet,
+                args.tsv_float_digits,
+                args.gzip_tsv,
+                args.event_read_workers
+            )
+        else:
+             logging.info("Skipping Task 2 based on arguments.")
 
     task3_success = True
     if not args.skip_task3:
          task3_success = create_timeseries_tsvs(
             args.price_history_dir,
-            args.timeseries_output_dir
+            args.timeseries_output_dir,
+            args.processes,
+            args.log_file,
+            args.quiet
          )
     else:
          logging.info("Skipping Task 3 based on arguments.")
 
 
     logging.info("--- Data Processing Script Finished ---")
+    task_results = []
     if not args.skip_task1:
-        logging.info(f"Task 1 (Save Market JSONs) Success: {task1_success}")
+        task_results.append(f"Task 1 (Save Market JSONs) Success: {task1_success}")
     if not args.skip_task2:
-        logging.info(f"Task 2 (Create Market/Event TSVs) Success: {task2_success}")
+        task_results.append(f"Task 2 (Create Market/Event TSVs) Success: {task2_success}")
     if not args.skip_task3:
-         logging.info(f"Task 3 (Create Timeseries TSVs) Success: {task3_success}") 
\ No newline at end of file
+        task_results.append(f"Task 3 (Create Timeseries TSVs) Success: {task3_success}")
+    for task_result in task_results:
+        logging.info(task_result)
+        if args.quiet:
+            print(task_result) 
\ No newline at end of file